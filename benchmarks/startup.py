@@ -0,0 +1,101 @@
+#! /usr/bin/env python
+
+"""
+Measure the time from the start of an nb2html.py process to its first written
+HTML file, for a cold template cache, a warm template cache and with the
+template cache disabled. Each run is a fresh process, as in a CI job that
+invokes nb2html.py once per notebook. By default a small notebook without
+citations is converted, so that neither pandoc nor a long kernel execution
+dominates the measurement.
+"""
+
+################################################################################
+
+# Module imports
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import nbformat
+
+################################################################################
+
+# Aliases and global variables
+thisdir = os.path.dirname(os.path.abspath(__file__))
+basedir = os.path.normpath(os.path.join(thisdir, '..'))
+script  = os.path.join(basedir, 'scripts', 'nb2html.py')
+
+################################################################################
+
+def time_to_first_html(notebook, env, extra_args=[]):
+    """
+    Run nb2html.py on the given notebook in a new process and return the number
+    of seconds from launching the process to the file_written event
+    """
+    log = notebook + '.events.jsonl'
+    if os.path.exists(log):
+        os.remove(log)
+    start = time.time()
+    subprocess.check_call([sys.executable, script, '--no-history',
+                           '--event-log', log] + extra_args + [notebook],
+                          env=env, stdout=subprocess.DEVNULL,
+                          stderr=subprocess.DEVNULL)
+    with open(log) as log_file:
+        for line in log_file:
+            record = json.loads(line)
+            if record['event'] == 'file_written':
+                return record['time'] - start
+    raise RuntimeError('No HTML file was written for "%s"' % notebook)
+
+################################################################################
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('notebook',
+                        nargs='?',
+                        default=None,
+                        help='notebook to convert (default: a one-cell notebook)')
+    parser.add_argument('-n',
+                        '--repeat',
+                        dest='repeat',
+                        type=int,
+                        default=5,
+                        help='number of warm runs to average')
+    options = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    try:
+        if options.notebook is None:
+            notebook = os.path.join(workdir, 'startup.ipynb')
+            nb = nbformat.v4.new_notebook()
+            nb.cells.append(nbformat.v4.new_code_cell('1 + 1'))
+            nbformat.write(nb, notebook)
+        else:
+            notebook = os.path.join(workdir, os.path.basename(options.notebook))
+            shutil.copyfile(options.notebook, notebook)
+
+        env = dict(os.environ)
+        env['NBREF_CACHE_DIR'] = os.path.join(workdir, 'cache')
+        python_path = env.get('PYTHONPATH', '').split(':')
+        env['PYTHONPATH'] = ':'.join([basedir] + python_path)
+
+        disabled = [time_to_first_html(notebook, env, ['--no-template-cache'])
+                    for i in range(options.repeat)]
+        cold = time_to_first_html(notebook, env)
+        warm = [time_to_first_html(notebook, env)
+                for i in range(options.repeat)]
+
+        print('Process start to first written HTML:')
+        print('    template cache disabled: %.3f s (mean of %d)' %
+              (sum(disabled) / len(disabled), len(disabled)))
+        print('    cold template cache:     %.3f s' % cold)
+        print('    warm template cache:     %.3f s (mean of %d)' %
+              (sum(warm) / len(warm), len(warm)))
+    finally:
+        shutil.rmtree(workdir)
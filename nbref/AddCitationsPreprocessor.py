@@ -2,10 +2,15 @@
 ################################################################################
 
 # Module imports
+import asyncio
+import hashlib
+import json
 import nbconvert
 import nbformat
 import os
 import pypandoc
+import sqlite3
+import time
 
 ################################################################################
 # Aliases and global variables
@@ -16,12 +21,20 @@ NotebookNode = nbformat.notebooknode.NotebookNode
 
 # Object imports
 from traitlets        import Bool
+from traitlets        import Instance
 from traitlets        import List
 from traitlets        import Unicode
 from traitlets.config import Config
 
 ################################################################################
 
+# Local imports
+from .CitationCache import CitationCache
+from .events        import Events
+from .events        import print_event
+
+################################################################################
+
 class AddCitationsPreprocessor(Preprocessor):
     """
     An nbconvert.preprocessors.Preprocessor class that adds citations to a
@@ -40,6 +53,15 @@ class AddCitationsPreprocessor(Preprocessor):
                        ['.', <location-of-this-script>/CSL])
         verbose      - Boolean that determines whether output to stdout is
                        turned on (default False) 
+        cache_file   - The name of the CitationCache database used to reuse
+                       the citations found in unchanged cells and the pandoc
+                       output for an unchanged set of citations. The empty
+                       string (the default) disables the cache, as does a
+                       database that cannot be opened.
+
+    Progress is reported through the events attribute, an nbref.Events object
+    that may be given to the constructor. When verbose is True the progress
+    messages are also printed.
 
     This preprocessor converts each citation instance with the appropriate text
     for the citation as defined by the CSL file. It also adds two cells to the
@@ -66,6 +88,22 @@ class AddCitationsPreprocessor(Preprocessor):
     verbose      = Bool(   False,
                            help='Determines whether to provide output to stdout',
                            config=True)
+    cache_file   = Unicode(u'',
+                           help='Name of the citation cache database, if any',
+                           config=True)
+    events       = Instance(Events, args=(),
+                           help='The nbref.Events object progress is reported to')
+
+    ############################################################################
+
+    def _emit(self, event, **data):
+        """
+        Emit the given progress event, printing it as well if verbose is True
+        and the events are not printed already
+        """
+        record = self.events.emit(event, **data)
+        if self.verbose and not self.events.subscribed(print_event):
+            print_event(record)
 
     ############################################################################
 
@@ -82,8 +120,14 @@ class AddCitationsPreprocessor(Preprocessor):
 
     def _clear_empty_cells(self, nb):
         """
-        Remove any empty cells from the given notebook
+        Remove any empty cells from the given notebook. The cell list is only
+        rebuilt if there is an empty cell to remove.
         """
+        for cell in nb.cells:
+            if self._is_cell_empty(cell):
+                break
+        else:
+            return
         new_list = []
         for cell in nb.cells:
             if not self._is_cell_empty(cell):
@@ -103,38 +147,62 @@ class AddCitationsPreprocessor(Preprocessor):
 
     ############################################################################
 
-    def _extract_citations(self, nb):
+    def _extract_citations(self, nb, cache=None):
         """
         Return a list of all the citations in the given notebook, in the order
-        in which they first appear. Each citation will appear only once
+        in which they first appear. Each citation will appear only once. If a
+        CitationCache is given, the citations of each cell are looked up by a
+        hash of the cell source, and only cells not found there are scanned.
         """
         citations = []
+        found = set()
         for cell in nb.cells:
-            ranges = []
-            source = cell.source
-            start = source.find('@',0)
-            end = 0
-            while start >= 0:
-                if start == 0 or source[start-1] in ['[',' ','-']:
-                    index = source.rfind('[',end,start)
-                    if not (index == -1 or self._is_index_in_ranges(index, ranges)):
-                        start = index
-                        end = source.find(']',start) + 1
-                    else:
-                        end1 = source.find(' ', start)
-                        end2 = source.find(',', start)
-                        end3 = source.find('.', start)
-                        if end1 == -1: end1 = len(source)
-                        if end2 == -1: end2 = len(source)
-                        if end3 == -1: end3 = len(source)
-                        end = min(end1, end2, end3)
-                    citation = source[start:end]
-                    if citation not in citations:
-                        citations.append(citation)
-                    ranges.append((start,end))
+            cell_citations = None
+            if cache is not None:
+                digest = hashlib.sha1(cell.source.encode('utf-8')).hexdigest()
+                cell_citations = cache.cell_citations(digest)
+            if cell_citations is None:
+                cell_citations = self._extract_cell_citations(cell.source)
+                if cache is not None:
+                    cache.store_cell_citations(digest, cell_citations)
+            for citation in cell_citations:
+                if citation not in found:
+                    found.add(citation)
+                    citations.append(citation)
+        return citations
+
+    ############################################################################
+
+    def _extract_cell_citations(self, source):
+        """
+        Return a list of all the citations in the given cell source, in the
+        order in which they first appear. Each citation will appear only once
+        """
+        citations = []
+        ranges = []
+        start = source.find('@',0)
+        end = 0
+        while start >= 0:
+            if start == 0 or source[start-1] in ['[',' ','-']:
+                index = source.rfind('[',end,start)
+                if not (index == -1 or self._is_index_in_ranges(index, ranges)):
+                    start = index
+                    end = source.find(']',start) + 1
                 else:
-                    end = start + 1
-                start = source.find('@',end)
+                    end1 = source.find(' ', start)
+                    end2 = source.find(',', start)
+                    end3 = source.find('.', start)
+                    if end1 == -1: end1 = len(source)
+                    if end2 == -1: end2 = len(source)
+                    if end3 == -1: end3 = len(source)
+                    end = min(end1, end2, end3)
+                citation = source[start:end]
+                if citation not in citations:
+                    citations.append(citation)
+                ranges.append((start,end))
+            else:
+                end = start + 1
+            start = source.find('@',end)
         return citations
 
     ############################################################################
@@ -164,41 +232,188 @@ class AddCitationsPreprocessor(Preprocessor):
         method is suitable as input to the _add_references() method.
         """
 
-        # Initialize the return arguments
-        substitutions = {}
-        references    = ""
+        (citations, csl_file, digest, rendered) = self._lookup_citations(nb)
+        if rendered is None:
+            self._emit('pandoc_started', csl=csl_file,
+                       bibliography=self.bibliography)
+            start = time.time()
+            body = self._run_pandoc(self._citations_markdown(citations),
+                                    csl_file)
+            self._emit('pandoc_finished', duration=time.time() - start)
+            rendered = self._parse_citations_html(citations, body)
+            self._store_rendered(digest, rendered)
+        return rendered
 
-        # Extract and check the number of citations
-        citations = self._extract_citations(nb)
-        num_citations = len(citations)
-        if self.verbose:
-            if num_citations== 1:
-                print('    1 citation found')
-            else:
-                print('    %d citations found' % num_citations)
-        if num_citations == 0:
-            return (substitutions, references)
+    ############################################################################
+
+    def _lookup_citations(self, nb):
+        """
+        Extract the citations of the given notebook and return a tuple
+        (citations, csl_file, digest, rendered). If the notebook has no
+        citations, rendered is an empty (substitutions, references) tuple. If
+        the cache holds the pandoc output for these citations and the current
+        BibTeX and CSL files, rendered is the cached tuple. Otherwise rendered
+        is None and pandoc has to be run; digest is the key under which its
+        result should be stored by _store_rendered().
+
+        The cache is opened and closed (committing the citations of any new
+        cells) here, so that no write transaction is held while pandoc runs.
+        """
+        cache = self._open_cache()
+        try:
+            citations = self._extract_citations(nb, cache)
+            if cache is not None:
+                cache.commit()
+            self._emit('citations_found', count=len(citations),
+                       citations=citations)
+            if not citations:
+                return (citations, None, None, ({}, ""))
+            csl_file = self._find_csl_file()
+            self._check_bibliography()
+            digest   = None
+            rendered = None
+            if cache is not None:
+                digest = self._rendered_digest(citations, csl_file)
+                rendered = cache.rendered(digest)
+                if rendered is not None:
+                    self._emit('citations_reused', csl=csl_file,
+                               bibliography=self.bibliography)
+            return (citations, csl_file, digest, rendered)
+        finally:
+            self._close_cache(cache)
+
+    ############################################################################
+
+    def _rendered_digest(self, citations, csl_file):
+        """
+        Return a hash of the ordered list of citations and of the contents of
+        the BibTeX and CSL files, which determine the output of pandoc
+        """
+        sha1 = hashlib.sha1(json.dumps(citations).encode('utf-8'))
+        for filename in (self.bibliography, csl_file):
+            with open(filename, 'rb') as f:
+                sha1.update(hashlib.sha1(f.read()).digest())
+        return sha1.hexdigest()
+
+    ############################################################################
+
+    def _store_rendered(self, digest, rendered):
+        """
+        Store the (substitutions, references) tuple produced by pandoc under
+        the given digest, in its own short transaction. Nothing is stored if
+        the cache is disabled (digest is None).
+        """
+        if digest is None:
+            return
+        cache = self._open_cache()
+        if cache is None:
+            return
+        try:
+            cache.store_rendered(digest, *rendered)
+        finally:
+            self._close_cache(cache)
+
+    ############################################################################
+
+    def _open_cache(self):
+        """
+        Return the CitationCache named by cache_file, or None if cache_file is
+        not set. If the cache cannot be opened, a warning is logged and None is
+        returned, so that the citations are processed without it.
+        """
+        if not self.cache_file:
+            return None
+        try:
+            return CitationCache(self.cache_file)
+        except (OSError, sqlite3.Error) as e:
+            self.log.warning('Citation cache "%s" disabled: %s',
+                             self.cache_file, e)
+            return None
+
+    ############################################################################
+
+    def _close_cache(self, cache):
+        """
+        Commit and close the given citation cache, if it is not None
+        """
+        if cache is not None:
+            cache.close()
 
-        # Build a markdown text field with citations only
+    ############################################################################
+
+    def _citations_markdown(self, citations):
+        """
+        Return a markdown text field containing only the given citations, one
+        per paragraph
+        """
         body = ""
         for citation in citations:
             body += citation + "\n\n"
+        return body
 
-        # Run the markdown text through pandoc with the pandoc-citeproc filter
-        csl_file = self._find_csl_file()
-        if self.verbose:
-            print('    Citation Style Language = "%s"' % csl_file         )
-            print('    BibTeX reference file   = "%s"' % self.bibliography)
+    ############################################################################
+
+    def _check_bibliography(self):
+        """
+        Raise an IOError if the BibTeX bibliography file does not exist
+        """
         if not os.path.isfile(self.bibliography):
             raise IOError('Could not find "%s"' % self.bibliography)
+
+    ############################################################################
+
+    def _run_pandoc(self, body, csl_file):
+        """
+        Convert the given markdown text to HTML with pandoc, formatting the
+        citations with the pandoc-citeproc filter and the given CSL file
+        """
         filters = ['pandoc-citeproc']
         extra_args = ['--bibliography="%s"' % self.bibliography,
                       '--csl="%s"' % csl_file]
-        body = pypandoc.convert_text(body,
+        return pypandoc.convert_text(body,
                                      'html',
                                      'md',
                                      filters=filters,
                                      extra_args=extra_args)
+
+    ############################################################################
+
+    async def _async_run_pandoc(self, body, csl_file):
+        """
+        Asynchronous version of _run_pandoc(), which runs pandoc as an asyncio
+        subprocess. If the calling task is cancelled, pandoc is killed.
+        """
+        process = await asyncio.create_subprocess_exec(
+            pypandoc.get_pandoc_path(),
+            '--from=markdown',
+            '--to=html',
+            '--filter=pandoc-citeproc',
+            '--bibliography=%s' % self.bibliography,
+            '--csl=%s' % csl_file,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE)
+        try:
+            (stdout, stderr) = await process.communicate(body.encode('utf-8'))
+        except asyncio.CancelledError:
+            process.kill()
+            await process.wait()
+            raise
+        if process.returncode != 0:
+            raise RuntimeError('pandoc failed: %s' %
+                               stderr.decode('utf-8', 'replace'))
+        return stdout.decode('utf-8').replace('\r\n', '\n')
+
+    ############################################################################
+
+    def _parse_citations_html(self, citations, body):
+        """
+        Given the list of citations and the HTML produced by pandoc from
+        _citations_markdown(), return the substitutions dictionary and the
+        references string described in _process_citations()
+        """
+        substitutions = {}
+        num_citations = len(citations)
         body = body.split('\n')
 
         # Extract the citation substitutions and the references section from the
@@ -264,3 +479,32 @@ class AddCitationsPreprocessor(Preprocessor):
             self._substitute_citations(nb, subs)
             self._add_references(nb, refs)
         return (nb, resources)
+
+    ############################################################################
+
+    async def async_preprocess(self, nb, resources):
+        """
+        Asynchronous version of preprocess(), which runs pandoc without
+        blocking the event loop. The citation cache is accessed in the default
+        executor, so that waiting for a lock held by another conversion does
+        not block the event loop either.
+        """
+        loop = asyncio.get_running_loop()
+        self._clear_empty_cells(nb)
+        (citations, csl_file, digest, rendered) = \
+            await loop.run_in_executor(None, self._lookup_citations, nb)
+        if rendered is None:
+            self._emit('pandoc_started', csl=csl_file,
+                       bibliography=self.bibliography)
+            start = time.time()
+            body = await self._async_run_pandoc(
+                self._citations_markdown(citations), csl_file)
+            self._emit('pandoc_finished', duration=time.time() - start)
+            rendered = self._parse_citations_html(citations, body)
+            await loop.run_in_executor(None, self._store_rendered, digest,
+                                       rendered)
+        (subs, refs) = rendered
+        if refs != "":
+            self._substitute_citations(nb, subs)
+            self._add_references(nb, refs)
+        return (nb, resources)
@@ -0,0 +1,94 @@
+################################################################################
+
+# Module imports
+import jinja2
+import nbconvert
+HTMLExporter = nbconvert.HTMLExporter
+
+################################################################################
+
+# Object imports
+from traitlets     import Bool
+from traitlets.log import get_logger
+
+################################################################################
+
+# Local imports
+from .cache import cache_dir
+
+################################################################################
+
+# Aliases and global variables
+_bytecode_caches = {}
+
+################################################################################
+
+class _BytecodeCache(jinja2.FileSystemBytecodeCache):
+    """
+    A jinja2.FileSystemBytecodeCache that logs a warning and carries on
+    without the cache, instead of failing the export, when a compiled template
+    cannot be read or written
+    """
+
+    def load_bytecode(self, bucket):
+        try:
+            super(_BytecodeCache, self).load_bytecode(bucket)
+        except OSError as e:
+            get_logger().warning('Could not read cached template: %s', e)
+
+    def dump_bytecode(self, bucket):
+        try:
+            super(_BytecodeCache, self).dump_bytecode(bucket)
+        except OSError as e:
+            get_logger().warning('Could not cache template: %s', e)
+
+################################################################################
+
+def template_bytecode_cache():
+    """
+    Return the Jinja bytecode cache shared by all CachedHTMLExporters in this
+    process that use the current nbref cache directory. Compiled templates are
+    stored in a subdirectory of the nbref cache directory named after the Jinja
+    and nbconvert versions, so upgrading either package starts a fresh cache.
+    Within it, Jinja keys every template by its name and file name and checks
+    the hash of its source, so edited templates are recompiled. Raise an
+    OSError if the cache directory cannot be created.
+    """
+    versions = 'jinja2-%s_nbconvert-%s' % (jinja2.__version__,
+                                           nbconvert.__version__)
+    directory = cache_dir('templates', versions)
+    if directory not in _bytecode_caches:
+        _bytecode_caches[directory] = _BytecodeCache(directory)
+    return _bytecode_caches[directory]
+
+################################################################################
+
+class CachedHTMLExporter(HTMLExporter):
+    """
+    An HTMLExporter whose Jinja environment uses an on-disk bytecode cache, so
+    that a new process does not have to parse and compile the nbconvert
+    templates again. It has the following configurable attribute:
+
+        template_cache - Boolean that determines whether compiled templates
+                         are cached on disk (default True)
+    """
+
+    template_cache = Bool(True,
+                          help='Cache compiled Jinja templates on disk',
+                          config=True)
+
+    ############################################################################
+
+    def _create_environment(self):
+        """
+        Create the Jinja templating environment, with the bytecode cache if
+        template_cache is True. If the cache directory cannot be created, a
+        warning is logged and the templates are compiled without the cache.
+        """
+        environment = super(CachedHTMLExporter, self)._create_environment()
+        if self.template_cache:
+            try:
+                environment.bytecode_cache = template_bytecode_cache()
+            except OSError as e:
+                self.log.warning('Template cache disabled: %s', e)
+        return environment
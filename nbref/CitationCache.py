@@ -0,0 +1,113 @@
+################################################################################
+
+# Module imports
+import json
+import os
+import sqlite3
+
+################################################################################
+
+# Local imports
+from .cache import cache_dir
+
+################################################################################
+
+class CitationCache(object):
+    """
+    A small SQLite database used by AddCitationsPreprocessor to avoid repeated
+    work on rebuilds. It stores
+
+        * the citation keys found in a cell, keyed by a hash of the cell source
+        * the citation substitutions and references section rendered by
+          pandoc, keyed by a hash of the ordered citation keys and of the
+          contents of the BibTeX and CSL files
+
+    It has the following attribute:
+
+        filename - The name of the database file (default
+                   <cache_dir>/citations.sqlite)
+
+    Changes are committed by commit() or close().
+    """
+
+    def __init__(self, filename=None):
+        """
+        Open (creating if necessary) the cache database
+        """
+        if filename is None:
+            filename = os.path.join(cache_dir(), 'citations.sqlite')
+        self.filename = filename
+        self._db = sqlite3.connect(filename, timeout=30)
+        self._db.execute('CREATE TABLE IF NOT EXISTS cells ('
+                         'digest TEXT PRIMARY KEY, '
+                         'citations TEXT NOT NULL)')
+        self._db.execute('CREATE TABLE IF NOT EXISTS rendered ('
+                         'digest TEXT PRIMARY KEY, '
+                         'substitutions TEXT NOT NULL, '
+                         'citation_references TEXT NOT NULL)')
+        self._db.commit()
+
+    ############################################################################
+
+    def cell_citations(self, digest):
+        """
+        Return the list of citations of the cell with the given source hash, or
+        None if it is not cached
+        """
+        row = self._db.execute('SELECT citations FROM cells WHERE digest = ?',
+                               (digest,)).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0])
+
+    ############################################################################
+
+    def store_cell_citations(self, digest, citations):
+        """
+        Cache the list of citations of the cell with the given source hash
+        """
+        self._db.execute('INSERT OR REPLACE INTO cells (digest, citations) '
+                         'VALUES (?, ?)', (digest, json.dumps(citations)))
+
+    ############################################################################
+
+    def rendered(self, digest):
+        """
+        Return the (substitutions, references) tuple rendered for the given
+        hash, or None if it is not cached
+        """
+        row = self._db.execute('SELECT substitutions, citation_references '
+                               'FROM rendered WHERE digest = ?',
+                               (digest,)).fetchone()
+        if row is None:
+            return None
+        return (json.loads(row[0]), row[1])
+
+    ############################################################################
+
+    def store_rendered(self, digest, substitutions, references):
+        """
+        Cache the given substitutions dictionary and references string under
+        the given hash
+        """
+        self._db.execute('INSERT OR REPLACE INTO rendered '
+                         '(digest, substitutions, citation_references) '
+                         'VALUES (?, ?, ?)',
+                         (digest, json.dumps(substitutions), references))
+
+    ############################################################################
+
+    def commit(self):
+        """
+        Commit the changes to the database
+        """
+        self._db.commit()
+
+    ############################################################################
+
+    def close(self):
+        """
+        Commit the changes and close the database connection
+        """
+        self._db.commit()
+        self._db.close()
@@ -0,0 +1,123 @@
+################################################################################
+
+# Module imports
+import os
+import sqlite3
+import time
+
+################################################################################
+
+# Local imports
+from .cache import cache_dir
+
+################################################################################
+
+class ExecutionHistory(object):
+    """
+    A small SQLite database that records how long each notebook took to
+    convert, and optionally its peak memory, so that batch runs can be
+    scheduled longest-expected-first and admitted within a memory budget. It
+    has the following attributes:
+
+        filename - The name of the database file (default
+                   <cache_dir>/history.sqlite)
+        weight   - The weight given to the most recent measurement when
+                   updating the expected duration and memory, exponentially
+                   weighted moving averages (default 0.5)
+
+    Notebooks are keyed by their real path, so that the same notebook reached
+    through different relative paths shares one history record.
+    """
+
+    def __init__(self, filename=None, weight=0.5):
+        """
+        Open (creating if necessary) the history database
+        """
+        if filename is None:
+            filename = os.path.join(cache_dir(), 'history.sqlite')
+        self.filename = filename
+        self.weight   = weight
+        self._db = sqlite3.connect(filename, timeout=30)
+        self._db.execute('CREATE TABLE IF NOT EXISTS durations ('
+                         'path TEXT PRIMARY KEY, '
+                         'runs INTEGER NOT NULL, '
+                         'expected REAL NOT NULL, '
+                         'last REAL NOT NULL, '
+                         'updated REAL NOT NULL, '
+                         'memory REAL)')
+        self._db.commit()
+
+    ############################################################################
+
+    def _key(self, notebook):
+        """
+        Return the database key for the given notebook filename
+        """
+        return os.path.realpath(notebook)
+
+    ############################################################################
+
+    def expected(self, notebook):
+        """
+        Return the expected conversion time of the given notebook in seconds,
+        or None if the notebook has never been converted
+        """
+        row = self._db.execute('SELECT expected FROM durations WHERE path = ?',
+                               (self._key(notebook),)).fetchone()
+        if row is None:
+            return None
+        return row[0]
+
+    ############################################################################
+
+    def expected_memory(self, notebook):
+        """
+        Return the expected peak memory of the given notebook's conversion in
+        bytes, or None if it has never been measured
+        """
+        row = self._db.execute('SELECT memory FROM durations WHERE path = ?',
+                               (self._key(notebook),)).fetchone()
+        if row is None:
+            return None
+        return row[0]
+
+    ############################################################################
+
+    def _average(self, new, old):
+        """
+        Return the exponentially weighted moving average of the given new and
+        old values, either of which may be None
+        """
+        if old is None:
+            return new
+        if new is None:
+            return old
+        return self.weight * new + (1.0 - self.weight) * old
+
+    ############################################################################
+
+    def record(self, notebook, seconds, memory=None):
+        """
+        Record that the given notebook took the given number of seconds to
+        convert, with the given peak memory in bytes if it was measured, and
+        update its expected duration and memory
+        """
+        key = self._key(notebook)
+        row = self._db.execute('SELECT runs, expected, memory FROM durations '
+                               'WHERE path = ?', (key,)).fetchone()
+        if row is None:
+            row = (0, None, None)
+        self._db.execute('INSERT OR REPLACE INTO durations '
+                         '(path, runs, expected, last, updated, memory) '
+                         'VALUES (?, ?, ?, ?, ?, ?)',
+                         (key, row[0] + 1, self._average(seconds, row[1]),
+                          seconds, time.time(), self._average(memory, row[2])))
+        self._db.commit()
+
+    ############################################################################
+
+    def close(self):
+        """
+        Close the database connection
+        """
+        self._db.close()
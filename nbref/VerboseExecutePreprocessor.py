@@ -1,10 +1,25 @@
 
 # Module imports
+import nbclient
 import nbconvert
+import time
 ExecutePreprocessor = nbconvert.preprocessors.ExecutePreprocessor
+NotebookClient      = nbclient.NotebookClient
+run_sync            = nbclient.util.run_sync
 
 # Object imports
 from traitlets import Bool
+from traitlets import Instance
+from traitlets import Int
+from traitlets import Unicode
+
+# Local imports
+from .events import Events
+from .events import print_event
+from .memory import MemoryWatchdog
+from .memory import kernel_pid
+from .memory import memory_measurable
+from .outputs import OutputLimiter
 
 ################################################################################
 
@@ -15,21 +30,258 @@ class VerboseExecutePreprocessor(ExecutePreprocessor):
 
         verbose      - Boolean that determines whether output to stdout is
                        turned on (default False)
+        memory_limit - The maximum memory, in bytes, the kernel may use. A
+                       kernel that exceeds it is killed and execution fails
+                       with a MemoryError (default 0, no limit)
+        track_memory - Boolean that determines whether the peak memory of the
+                       kernel is measured when there is no memory_limit
+                       (default False)
+        max_stream_output - The maximum number of characters kept for each
+                       output stream of a cell, half from its start and half
+                       from its end (default 0, no limit)
+        max_cell_output - The maximum number of characters kept for all the
+                       outputs of a cell (default 0, no limit)
+        spill_dir    - If not empty, the directory in which the full text of
+                       truncated streams is written (default '')
+        spill_url    - The URL of spill_dir relative to the HTML file, used to
+                       link the full text from the notebook (default '')
+
+    Outputs are truncated while the cell executes, so the memory used and the
+    size of the HTML stay bounded whatever the notebook prints (see
+    nbref.outputs.OutputLimiter).
 
         Inherited from ExecuteProcess:
 
             kernel_name  - The name of the kernel for executing the
                            notebook. Either 'python2' or 'python3'
             timeout      - Execution time before quitting
+
+    Progress, including the execution time of every cell, is reported through
+    the events attribute, an nbref.Events object that may be given to the
+    constructor.
     """
 
     verbose = Bool(False,
                    help='Determines whether to provide output to stdout',
                    config=True)
+    events  = Instance(Events, args=(),
+                       help='The nbref.Events object progress is reported to')
+    memory_limit = Int(0,
+                       help='Maximum kernel memory in bytes (0 for no limit)',
+                       config=True)
+    track_memory = Bool(False,
+                        help='Determines whether the peak kernel memory is measured',
+                        config=True)
+
+    max_stream_output = Int(0,
+                            help='Maximum characters kept per output stream of a cell (0 for no limit)',
+                            config=True)
+    max_cell_output   = Int(0,
+                            help='Maximum characters kept for all the outputs of a cell (0 for no limit)',
+                            config=True)
+    spill_dir         = Unicode(u'',
+                                help='Directory for the full text of truncated streams',
+                                config=True)
+    spill_url         = Unicode(u'',
+                                help='URL of spill_dir relative to the HTML file',
+                                config=True)
+
+    _watchdog = None
+    _limiter  = None
+
+    ############################################################################
+
+    def _emit(self, event, **data):
+        """
+        Emit the given progress event, printing it as well if verbose is True
+        and the events are not printed already
+        """
+        record = self.events.emit(event, **data)
+        if self.verbose and not self.events.subscribed(print_event):
+            print_event(record)
+
+    ############################################################################
+
+    def _memory_unavailable(self, reason):
+        """
+        Report that the memory of the kernel cannot be watched for the given
+        reason: raise a RuntimeError if memory_limit is set, since the limit
+        cannot be enforced, or log a warning otherwise
+        """
+        if self.memory_limit:
+            raise RuntimeError('Cannot enforce the memory limit: %s' % reason)
+        self.log.warning('Kernel memory not measured: %s', reason)
+
+    ############################################################################
+
+    def _start_watchdog(self):
+        """
+        Start watching the memory of the kernel, if memory_limit or
+        track_memory is set
+        """
+        if not (self.memory_limit or self.track_memory):
+            return
+        pid = kernel_pid(self.km)
+        if pid is None:
+            self._memory_unavailable('the process id of the kernel is unknown')
+            return
+        self._watchdog = MemoryWatchdog(pid, self.memory_limit)
+        self._watchdog.start()
+
+    ############################################################################
+
+    def _stop_watchdog(self):
+        """
+        Stop watching the memory of the kernel and emit a kernel_memory event
+        with its peak memory (None if it was never measured). Raise a
+        MemoryError if the kernel was killed for exceeding memory_limit.
+        """
+        watchdog = self._watchdog
+        if watchdog is None:
+            return
+        self._watchdog = None
+        watchdog.stop()
+        peak = watchdog.peak if watchdog.measured else None
+        self._emit('kernel_memory', peak=peak, killed=watchdog.exceeded)
+        if watchdog.exceeded:
+            raise MemoryError('Kernel killed after exceeding the memory limit '
+                              'of %d MB' % (self.memory_limit // 2**20))
+
+    ############################################################################
+
+    async def async_start_new_kernel(self, **kwargs):
+        """
+        Start a new kernel and, if requested, watch its memory. If memory_limit
+        is set but the memory of the kernel cannot be measured, a RuntimeError
+        is raised (before the kernel is started, when possible).
+        """
+        if ((self.memory_limit or self.track_memory) and
+            not memory_measurable()):
+            self._memory_unavailable('process memory cannot be measured on '
+                                     'this system (install psutil)')
+        await ExecutePreprocessor.async_start_new_kernel(self, **kwargs)
+        try:
+            self._start_watchdog()
+        except Exception:
+            await self._async_cleanup_kernel()
+            raise
+
+    start_new_kernel = run_sync(async_start_new_kernel)
 
     ############################################################################
 
     def preprocess(self, nb, resources):
-        if self.verbose:
-            print('    Executing notebook...')
-        return ExecutePreprocessor.preprocess(self, nb, resources)
+        self._emit('execution_started')
+        try:
+            return ExecutePreprocessor.preprocess(self, nb, resources)
+        finally:
+            self._stop_watchdog()
+
+    ############################################################################
+
+    async def async_preprocess(self, nb, resources):
+        """
+        Asynchronous version of preprocess(), which drives the kernel with the
+        asynchronous kernel client so that many notebooks can be executed
+        concurrently on one event loop. If the calling task is cancelled, the
+        kernel is shut down.
+        """
+        self._emit('execution_started')
+        NotebookClient.__init__(self, nb)
+        self._check_assign_resources(resources)
+        try:
+            await self.async_execute()
+        finally:
+            self._stop_watchdog()
+        return (self.nb, self.resources)
+
+    ############################################################################
+
+    async def async_execute_cell(self, cell, cell_index, *args, **kwargs):
+        """
+        Execute the given cell and, if it is a code cell that was run, emit a
+        cell_executed event with its execution time
+        """
+        start = time.time()
+        self._limiter = self._new_limiter(cell_index)
+        try:
+            cell = await ExecutePreprocessor.async_execute_cell(self, cell,
+                                                               cell_index,
+                                                               *args, **kwargs)
+        finally:
+            if self._limiter is not None:
+                cell.outputs.extend(self._limiter.finish())
+                self._limiter = None
+        if cell.cell_type == 'code' and cell.source.strip():
+            self._emit('cell_executed', index=cell_index,
+                       cell_type=cell.cell_type, duration=time.time() - start)
+        return cell
+
+    # The synchronous wrapper must be rebound so that preprocess() also goes
+    # through the override above
+    execute_cell = run_sync(async_execute_cell)
+
+    ############################################################################
+
+    def _new_limiter(self, cell_index):
+        """
+        Return an OutputLimiter for the given cell, or None if outputs are not
+        limited
+        """
+        if not (self.max_stream_output or self.max_cell_output):
+            return None
+        return OutputLimiter(cell_index, self.max_stream_output,
+                             self.max_cell_output, self.spill_dir,
+                             self.spill_url)
+
+    ############################################################################
+
+    def output(self, outs, msg, display_id, cell_index):
+        """
+        Handle an output message from the kernel, truncating or dropping it to
+        keep the outputs of the cell within limits
+        """
+        limiter = self._limiter
+        if limiter is not None:
+            msg_type = msg['msg_type']
+            content  = msg['content']
+            if msg_type == 'stream':
+                text = limiter.stream_text(content['name'], content['text'])
+                if not text:
+                    return self._drop_output(outs, cell_index)
+                content = dict(content, text=text)
+            elif msg_type == 'error':
+                content = dict(content,
+                               traceback=limiter.traceback(content['traceback']))
+            elif msg_type in ['display_data', 'execute_result']:
+                data = content.get('data', {})
+                size = sum([len(value) for value in data.values()
+                            if isinstance(value, str)])
+                if not limiter.keep_output(size):
+                    return self._drop_output(outs, cell_index)
+            msg = dict(msg, content=content)
+        return ExecutePreprocessor.output(self, outs, msg, display_id,
+                                          cell_index)
+
+    ############################################################################
+
+    def _drop_output(self, outs, cell_index):
+        """
+        Drop an output message. A clear_output(wait=True) waiting for the next
+        output is applied all the same, as the base class would have done.
+        """
+        if self.clear_before_next_output:
+            outs[:] = []
+            self.clear_display_id_mapping(cell_index)
+            self.clear_before_next_output = False
+        return None
+
+    ############################################################################
+
+    def clear_output(self, outs, msg, cell_index):
+        """
+        Clear the outputs of the cell, and start counting them afresh
+        """
+        if self._limiter is not None:
+            self._limiter.clear()
+        return ExecutePreprocessor.clear_output(self, outs, msg, cell_index)
@@ -1,9 +1,31 @@
 __all__ = ['AddCitationsExporter',
            'AddCitationsPreprocessor',
+           'CachedHTMLExporter',
+           'CitationCache',
+           'Events',
+           'ExecutionHistory',
+           'JsonLinesLog',
            'VerboseExecutePreprocessor',
-           'convert']
+           'convert',
+           'convert_archive',
+           'convert_async',
+           'convert_batch',
+           'load_notebook',
+           'print_event',
+           'schedule']
 
 from .AddCitationsExporter       import AddCitationsExporter
 from .AddCitationsPreprocessor   import AddCitationsPreprocessor
+from .CachedHTMLExporter         import CachedHTMLExporter
+from .CitationCache              import CitationCache
+from .ExecutionHistory           import ExecutionHistory
+from .events                     import Events
+from .events                     import JsonLinesLog
+from .events                     import print_event
 from .VerboseExecutePreprocessor import VerboseExecutePreprocessor
 from .convert                    import convert
+from .convert_async              import convert_async
+from .archive                    import convert_archive
+from .batch                      import convert_batch
+from .load                       import load_notebook
+from .batch                      import schedule
@@ -0,0 +1,303 @@
+"""
+Convert every notebook in a zip or tar archive and write the HTML files (and
+any extracted resources) directly into an output archive, without unpacking the
+notebooks to disk or writing the HTML files individually. Only the other
+members of the input archive, such as BibTeX databases, CSL files and data
+files the notebooks read, are extracted to a temporary directory (one per input
+archive), which serves as the working directory of the kernels. Memory use is
+bounded by the number of notebooks in flight, at most twice the number of worker
+processes. The notebook paths must be unique across the input archives, since
+their HTML files share the output archive.
+"""
+
+################################################################################
+
+# Module imports
+import copy
+import io
+import multiprocessing
+import os
+import posixpath
+import shutil
+import tarfile
+import tempfile
+import time
+import traceback
+import zipfile
+
+################################################################################
+
+# Local imports
+from .batch   import BatchResult
+from .batch   import _drain
+from .batch   import sep
+from .convert import _events
+from .convert import _export
+from .events  import Events
+from .load    import reads_notebook
+
+################################################################################
+
+def _member_path(name):
+    """
+    Return the given archive member name as a normalized relative POSIX path,
+    or None if it is unsafe to extract (absolute, or outside the archive)
+    """
+    path = posixpath.normpath(name.replace('\\', '/'))
+    if path.startswith('/') or path == '..' or path.startswith('../'):
+        return None
+    return path
+
+################################################################################
+
+def _iter_members(filename):
+    """
+    Iterate sequentially over the regular files of the given zip or tar
+    archive, yielding tuples of the normalized member path and a readable file
+    object for its contents. Tar archives, compressed or not, are read as a
+    stream.
+    """
+    if zipfile.is_zipfile(filename):
+        with zipfile.ZipFile(filename) as archive:
+            for info in archive.infolist():
+                path = _member_path(info.filename)
+                if path is None or info.filename.endswith('/'):
+                    continue
+                with archive.open(info) as member:
+                    yield (path, member)
+    else:
+        with tarfile.open(filename, 'r|*') as archive:
+            for info in archive:
+                path = _member_path(info.name)
+                if path is None or not info.isfile():
+                    continue
+                yield (path, archive.extractfile(info))
+
+################################################################################
+
+class _ArchiveWriter(object):
+    """
+    Write files into a zip archive, or a tar archive compressed according to
+    the file extension (.tar, .tar.gz/.tgz, .tar.bz2, .tar.xz)
+    """
+
+    def __init__(self, filename):
+        if filename.endswith('.zip'):
+            self._zip = zipfile.ZipFile(filename, 'w', zipfile.ZIP_DEFLATED)
+            self._tar = None
+        else:
+            mode = 'w'
+            for (extensions, compression) in [(('.tar.gz', '.tgz'), 'gz'),
+                                              (('.tar.bz2', '.tbz2'), 'bz2'),
+                                              (('.tar.xz', '.txz'), 'xz')]:
+                if filename.endswith(extensions):
+                    mode = 'w:' + compression
+            self._zip = None
+            self._tar = tarfile.open(filename, mode)
+
+    def write(self, name, data):
+        """
+        Write the given bytes to the archive member with the given name
+        """
+        if self._zip is not None:
+            self._zip.writestr(name, data)
+        else:
+            info = tarfile.TarInfo(name)
+            info.size  = len(data)
+            info.mtime = time.time()
+            self._tar.addfile(info, io.BytesIO(data))
+
+    def close(self):
+        if self._zip is not None:
+            self._zip.close()
+        else:
+            self._tar.close()
+
+################################################################################
+
+def _extract_support_files(filenames, workdir):
+    """
+    Extract every member of the given archives that is not a notebook into a
+    numbered subdirectory of the given working directory, one per archive, and
+    return the list of notebooks, as tuples of the archive filename, the member
+    path and the directory the archive was extracted to. Raise a ValueError if
+    two notebooks have the same member path.
+    """
+    notebooks = []
+    seen      = {}
+    for (index, filename) in enumerate(filenames):
+        archive_dir = os.path.join(workdir, str(index))
+        os.mkdir(archive_dir)
+        for (path, member) in _iter_members(filename):
+            if path.endswith('.ipynb'):
+                if path in seen:
+                    raise ValueError('Notebook "%s" appears more than once in '
+                                     'the input archives ("%s", "%s")' %
+                                     (path, seen[path], filename))
+                seen[path] = filename
+                notebooks.append((filename, path, archive_dir))
+                continue
+            destination = os.path.join(archive_dir, *path.split('/'))
+            if not os.path.isdir(os.path.dirname(destination)):
+                os.makedirs(os.path.dirname(destination))
+            with open(destination, 'wb') as support_file:
+                shutil.copyfileobj(member, support_file)
+    return notebooks
+
+################################################################################
+
+def _member_options(path, options, workdir):
+    """
+    Return a copy of the given options for converting the notebook at the given
+    member path. A relative BibTeX database is looked up in the notebook's
+    directory inside the archive, then at the top of the archive, before
+    falling back to the given path. The notebook's directory inside the
+    archive is prepended to the CSL path.
+    """
+    notebook_dir = os.path.join(workdir, *posixpath.dirname(path).split('/'))
+    member_options = copy.copy(options)
+    if not os.path.isabs(options.bib):
+        for directory in [notebook_dir, workdir]:
+            candidate = os.path.join(directory, options.bib)
+            if os.path.isfile(candidate):
+                member_options.bib = candidate
+                break
+    member_options.csl_path = [notebook_dir] + list(options.csl_path)
+    return member_options
+
+################################################################################
+
+def _convert_member(path, data, options, workdir, parent=None, queue=None,
+                    reraise=False):
+    """
+    Convert the notebook with the given member path and contents. Return a
+    tuple of the elapsed time, the error message (None on success) and a list
+    of (member path, bytes) tuples to write to the output archive. This is the
+    unit of work handed to the worker processes. Progress events are reported
+    to the given parent Events object or, from a worker process, put on the
+    given queue. If reraise is True, exceptions propagate to the caller.
+    """
+    if queue is not None:
+        parent = Events()
+        parent.subscribe(queue.put)
+    start = time.time()
+    try:
+        events = _events(path, options, parent)
+        events.emit('notebook_started')
+        notebook = reads_notebook(data, getattr(options, 'validate', 'always'),
+                                  events, start)
+        notebook_dir = os.path.join(workdir,
+                                    *posixpath.dirname(path).split('/'))
+        if not os.path.isdir(notebook_dir):
+            os.makedirs(notebook_dir)
+        resources = {'metadata': {'path': notebook_dir}}
+        (body, resources) = _export(notebook,
+                                    _member_options(path, options, workdir),
+                                    events, resources)
+        html = posixpath.splitext(path)[0] + resources.get('output_extension',
+                                                           '.html')
+        outputs = [(html, body.encode('utf-8'))]
+        for (name, output) in resources.get('outputs', {}).items():
+            outputs.append((posixpath.join(posixpath.dirname(path), name),
+                            output))
+        events.emit('file_written', filename=html, size=len(outputs[0][1]))
+        events.emit('notebook_finished', duration=time.time() - start)
+        return (time.time() - start, None, outputs)
+    except Exception as e:
+        if reraise:
+            raise
+        if getattr(options, 'debug', False):
+            error = traceback.format_exc()
+        else:
+            error = str(e)
+        return (time.time() - start, error, [])
+
+################################################################################
+
+def convert_archive(filenames, output, options, jobs=1, events=None):
+    """
+    Convert every notebook in the given list of zip or tar archives, writing
+    the HTML files into the given output archive (zip or tar, according to its
+    file extension) under the same member paths, using up to the given number
+    of worker processes. Progress events are reported to the given
+    nbref.Events object, if any. Return a list of BatchResult tuples, one per
+    notebook, in order of completion. Raise a ValueError if two notebooks in
+    the input archives have the same member path.
+
+    With jobs == 1 the notebooks are converted in this process and, if
+    options.debug is set, exceptions propagate to the caller.
+    """
+    debug   = getattr(options, 'debug', False)
+    workdir = tempfile.mkdtemp(prefix='nbref-')
+    writer  = _ArchiveWriter(output)
+    results = []
+
+    def finish(path, elapsed, error, outputs):
+        if error is not None:
+            print('Error: %s: %s' % (path, error))
+            if events is not None:
+                events.emit('notebook_failed', notebook=path, error=error)
+        for (name, data) in outputs:
+            writer.write(name, data)
+        results.append(BatchResult(path, None, elapsed, error, None))
+        if options.verbose:
+            print(sep)
+
+    try:
+        notebooks = _extract_support_files(filenames, workdir)
+        wanted = dict([((filename, path), archive_dir)
+                       for (filename, path, archive_dir) in notebooks])
+
+        def read_notebooks():
+            for filename in filenames:
+                for (path, member) in _iter_members(filename):
+                    if (filename, path) in wanted:
+                        yield (path, member.read(), wanted[(filename, path)])
+
+        if jobs <= 1:
+            for (path, data, archive_dir) in read_notebooks():
+                finish(path, *_convert_member(path, data, options, archive_dir,
+                                              events, reraise=debug))
+            return results
+
+        queue   = None
+        manager = None
+        if events is not None:
+            manager = multiprocessing.Manager()
+            queue   = manager.Queue()
+        pool = multiprocessing.Pool(jobs)
+        try:
+            pending = []
+            source  = read_notebooks()
+            exhausted = False
+            while pending or not exhausted:
+                # Keep at most twice as many notebooks in flight as workers
+                while not exhausted and len(pending) < 2 * jobs:
+                    try:
+                        (path, data, archive_dir) = next(source)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    pending.append((path, pool.apply_async(
+                        _convert_member, (path, data, options, archive_dir,
+                                          None, queue))))
+                if queue is not None:
+                    _drain(queue, events)
+                for item in pending:
+                    if item[1].ready():
+                        if queue is not None:
+                            _drain(queue, events)
+                        finish(item[0], *item[1].get())
+                        pending.remove(item)
+                        break
+                else:
+                    time.sleep(0.05)
+        finally:
+            pool.close()
+            pool.join()
+            if manager is not None:
+                manager.shutdown()
+        return results
+    finally:
+        writer.close()
+        shutil.rmtree(workdir)
@@ -0,0 +1,266 @@
+################################################################################
+
+# Module imports
+import collections
+import copy
+import multiprocessing
+import time
+import traceback
+
+################################################################################
+
+# Local imports
+from .convert import convert
+from .events  import Events
+from .memory  import peak_rss
+
+################################################################################
+
+# Aliases and global variables
+BatchResult = collections.namedtuple('BatchResult',
+                                     ['filename', 'predicted', 'elapsed',
+                                      'error', 'memory'])
+sep = '----------------'
+
+################################################################################
+
+def schedule(filenames, history=None):
+    """
+    Return a list of (filename, predicted) tuples giving the order in which the
+    given notebooks should be converted. Notebooks are ordered by their expected
+    conversion time according to the given ExecutionHistory, longest first, so
+    that slow notebooks do not end up at the tail of a parallel run. Notebooks
+    with no history (predicted is None) are scheduled first, since they could
+    be arbitrarily long. Ties keep the order of the given filenames.
+    """
+    predictions = []
+    for filename in filenames:
+        if history is None:
+            predictions.append((filename, None))
+        else:
+            predictions.append((filename, history.expected(filename)))
+    if history is None:
+        return predictions
+    unknown = [p for p in predictions if p[1] is None]
+    known   = [p for p in predictions if p[1] is not None]
+    known.sort(key=lambda p: p[1], reverse=True)
+    return unknown + known
+
+################################################################################
+
+def _convert_measured(filename, options, events, own_process=True):
+    """
+    Convert a single notebook and return its peak memory in bytes, or None if
+    options.track_memory is not set or the memory of the kernel could not be
+    measured. The peak memory is that of the kernel, plus the peak of this
+    process if own_process is True. The peak of this process is the peak over
+    its whole lifetime, so own_process should only be True when the process
+    converts a single notebook.
+    """
+    kernel = [None]
+    def on_event(record):
+        if record['event'] == 'kernel_memory' and record['peak'] is not None:
+            kernel[0] = max(kernel[0] or 0, record['peak'])
+    measured = Events(events)
+    measured.subscribe(on_event)
+    convert(filename, options, measured)
+    if not getattr(options, 'track_memory', False) or kernel[0] is None:
+        return None
+    if not own_process:
+        return kernel[0]
+    return peak_rss() + kernel[0]
+
+################################################################################
+
+def _convert_file(filename, options, queue=None):
+    """
+    Convert a single notebook, returning a tuple of the elapsed time in seconds,
+    an error message (None on success) and the peak memory (see
+    _convert_measured()). This is the unit of work handed to the worker
+    processes of a parallel batch. If a queue is given, progress event records
+    are put on it so the parent process can dispatch them.
+    """
+    events = None
+    if queue is not None:
+        events = Events()
+        events.subscribe(queue.put)
+    start = time.time()
+    memory = None
+    try:
+        memory = _convert_measured(filename, options, events)
+        error = None
+    except Exception as e:
+        if options.debug:
+            error = traceback.format_exc()
+        else:
+            error = str(e)
+    return (time.time() - start, error, memory)
+
+################################################################################
+
+def _drain(queue, events):
+    """
+    Dispatch every event record waiting on the given queue to the given Events
+    object
+    """
+    while not queue.empty():
+        events.dispatch(queue.get())
+
+################################################################################
+
+def convert_batch(filenames, options, jobs=1, history=None, events=None,
+                  memory_budget=None):
+    """
+    Convert the given notebooks, using up to the given number of worker
+    processes, in the order returned by schedule(). The duration of every
+    successful conversion is recorded in the given ExecutionHistory, if any.
+    Progress events, including those of the worker processes, are reported to
+    the given nbref.Events object, if any. Return a list of BatchResult tuples
+    in scheduled order.
+
+    If a memory budget (in bytes) is given, or options.memory_limit is set,
+    the peak memory of every conversion (kernel plus converter process) is
+    measured and recorded in the history, and every worker process converts a
+    single notebook. With a memory budget, a notebook is only started while
+    its expected memory, taken from the history, fits in the budget left by
+    the running conversions; a notebook with no history is expected to use
+    options.memory_limit, or the budget divided by the number of jobs. The
+    first notebook in the schedule that fits is started, and a notebook is
+    always started when nothing else is running.
+
+    With jobs == 1 the notebooks are converted in this process and, if
+    options.debug is set, exceptions propagate to the caller. The peak memory
+    of this process then covers every notebook converted so far, so only the
+    kernel's peak memory is measured.
+    """
+    order   = schedule(filenames, history)
+    results = [None] * len(order)
+
+    memory_limit = int(getattr(options, 'memory_limit', 0) or 0)
+    tracking = memory_budget is not None or memory_limit > 0
+    if tracking:
+        options = copy.copy(options)
+        options.track_memory = True
+
+    def finish(index, elapsed, error, memory):
+        (filename, predicted) = order[index]
+        if error is not None:
+            print("Error: %s" % error)
+            if events is not None:
+                events.emit('notebook_failed', notebook=filename, error=error)
+        elif history is not None:
+            history.record(filename, elapsed, memory)
+        results[index] = BatchResult(filename, predicted, elapsed, error,
+                                     memory)
+        if options.verbose:
+            print(sep)
+
+    if jobs <= 1:
+        for (index, (filename, predicted)) in enumerate(order):
+            start  = time.time()
+            memory = None
+            if options.debug:
+                memory = _convert_measured(filename, options, events, False)
+                error = None
+            else:
+                try:
+                    memory = _convert_measured(filename, options, events,
+                                               False)
+                    error = None
+                except Exception as e:
+                    error = str(e)
+            finish(index, time.time() - start, error, memory)
+        return results
+
+    # Expected memory of each notebook, for admission control
+    if memory_budget is None:
+        default_footprint = 0
+    else:
+        default_footprint = memory_limit or memory_budget // jobs
+    def footprint(index):
+        memory = None
+        if history is not None:
+            memory = history.expected_memory(order[index][0])
+        if memory is None:
+            memory = default_footprint
+        return memory
+
+    def admit(waiting, running):
+        in_use = sum([item[1] for item in running])
+        for index in waiting:
+            memory = footprint(index)
+            if (memory_budget is None or not running or
+                in_use + memory <= memory_budget):
+                return (index, memory, in_use)
+        return None
+
+    # Worker processes report their progress events through a managed queue
+    queue   = None
+    manager = None
+    if events is not None:
+        manager = multiprocessing.Manager()
+        queue   = manager.Queue()
+    pool = multiprocessing.Pool(jobs, maxtasksperchild=1 if tracking else None)
+    try:
+        waiting = list(range(len(order)))
+        running = []
+        while waiting or running:
+            # Start as many notebooks as the jobs and memory budget allow
+            while waiting and len(running) < jobs:
+                admitted = admit(waiting, running)
+                if admitted is None:
+                    break
+                (index, memory, in_use) = admitted
+                waiting.remove(index)
+                if events is not None and memory_budget is not None:
+                    events.emit('notebook_admitted', notebook=order[index][0],
+                                expected_memory=memory, memory_in_use=in_use)
+                running.append((index, memory, pool.apply_async(
+                    _convert_file, (order[index][0], options, queue))))
+            if queue is not None:
+                _drain(queue, events)
+            for item in running:
+                if item[2].ready():
+                    if queue is not None:
+                        _drain(queue, events)
+                    finish(item[0], *item[2].get())
+                    running.remove(item)
+                    break
+            else:
+                time.sleep(0.05)
+    finally:
+        pool.close()
+        pool.join()
+        if manager is not None:
+            manager.shutdown()
+    return results
+
+################################################################################
+
+def print_schedule(results, wall_time=None):
+    """
+    Print a report of the given BatchResult list, showing the order in which
+    the notebooks were scheduled and their predicted and actual conversion
+    times. If given, the wall-clock time of the whole batch is also reported.
+    """
+    print('Order  Predicted   Actual  Peak MB  Status  Notebook')
+    for (index, result) in enumerate(results):
+        if result.predicted is None:
+            predicted = '       -'
+        else:
+            predicted = '%8.1f' % result.predicted
+        if result.memory is None:
+            memory = '      -'
+        else:
+            memory = '%7.0f' % (result.memory / 2.0**20)
+        if result.error is None:
+            status = 'ok    '
+        else:
+            status = 'failed'
+        print('%5d   %s %8.1f  %s  %s  %s' % (index + 1, predicted,
+                                              result.elapsed, memory, status,
+                                              result.filename))
+    total = sum([result.elapsed for result in results])
+    print('Total conversion time: %.1f s' % total)
+    if wall_time is not None:
+        print('Wall-clock time:       %.1f s' % wall_time)
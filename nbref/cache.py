@@ -0,0 +1,30 @@
+################################################################################
+
+# Module imports
+import os
+
+################################################################################
+
+def cache_dir(*subdirs):
+    """
+    Return the path of the nbref user cache directory, creating it if it does
+    not already exist. The location is taken from the NBREF_CACHE_DIR
+    environment variable if it is set, otherwise from $XDG_CACHE_HOME/nbref,
+    falling back to ~/.cache/nbref. Any given subdirectory names are appended
+    to the path.
+    """
+    path = os.environ.get('NBREF_CACHE_DIR')
+    if not path:
+        base = os.environ.get('XDG_CACHE_HOME')
+        if not base:
+            base = os.path.join(os.path.expanduser('~'), '.cache')
+        path = os.path.join(base, 'nbref')
+    path = os.path.join(path, *subdirs)
+    if not os.path.isdir(path):
+        try:
+            os.makedirs(path)
+        except OSError:
+            # Another process may have created it first
+            if not os.path.isdir(path):
+                raise
+    return path
@@ -1,44 +1,69 @@
-
 ################################################################################
 
 # Module imports
 import nbconvert
-import nbformat
 import os
+import time
 
 ################################################################################
 
 # Object imports
 from traitlets.config import Config
+from traitlets.log    import get_logger
 
 ################################################################################
 
 # Local imports
 from .AddCitationsPreprocessor   import AddCitationsPreprocessor
+from .CachedHTMLExporter         import CachedHTMLExporter
 from .VerboseExecutePreprocessor import VerboseExecutePreprocessor
+from .cache                      import cache_dir
+from .events                     import Events
+from .events                     import print_event
+from .load                       import load_notebook
 
 ################################################################################
 
 # Aliases and global variables
-HTMLExporter = nbconvert.HTMLExporter
 FilesWriter  = nbconvert.writers.FilesWriter
 
 ################################################################################
 
-def convert(filename, options):
+def _events(filename, options, events):
     """
-    Take as input a filename for a Jupyter Notebook (and a variety of options)
-    and write an HTML file that is a representation of that notebook.
+    Return a new Events object for the conversion of the given notebook, which
+    adds the notebook name to every event and forwards the events to the given
+    parent Events object (if any). If options.verbose is set, the events are
+    also printed, unless the parent prints them already.
     """
+    events = Events(events, notebook=filename)
+    if options.verbose and not events.subscribed(print_event):
+        events.subscribe(print_event)
+    return events
 
-    # Open the Jupyter notebook
+################################################################################
+
+def _read(filename, options, events):
+    """
+    Read the given Jupyter notebook file and return a tuple of the basename of
+    the file and the notebook. The notebook is validated according to
+    options.validate (see load_notebook()), which defaults to 'always'.
+    """
     (basename, ext) = os.path.splitext(filename)
-    response = open(filename,"r").read()
-    if options.verbose:
-        print('Reading "%s"' % filename)
-    notebook = nbformat.reads(response, as_version=4)
+    events.emit('notebook_started')
+    notebook = load_notebook(filename, getattr(options, 'validate', 'always'),
+                             events)
+    return (basename, notebook)
 
-    # Configure the HTMLExporter to use the preprocessors
+################################################################################
+
+def _configure(options, basename=None):
+    """
+    Return the traitlets Config for the nbref preprocessors and exporter, built
+    from the given options. If options.spill_outputs is set and the basename
+    of the HTML file is given, the full text of truncated output streams is
+    written to the <basename>_outputs directory.
+    """
     cfg = Config()
     cfg.ExecutePreprocessor.enabled           = True
     cfg.ExecutePreprocessor.kernel_name       = options.kernel
@@ -51,18 +76,77 @@ def convert(filename, options):
     cfg.AddCitationsPreprocessor.csl_path     = options.csl_path
     cfg.AddCitationsPreprocessor.bibliography = options.bib
     cfg.AddCitationsPreprocessor.header       = options.header
-    cfg.HTMLExporter.preprocessors = [VerboseExecutePreprocessor(config=cfg),
-                                      AddCitationsPreprocessor(config=cfg)]
+
+    # Settings that option objects built by callers of the API may not define
+    memory_limit   = int(getattr(options, 'memory_limit', 0) or 0)
+    track_memory   = getattr(options, 'track_memory'  , False)
+    template_cache = getattr(options, 'template_cache', True )
+    max_stream     = int(getattr(options, 'max_stream_output', 0) or 0)
+    max_cell       = int(getattr(options, 'max_cell_output'  , 0) or 0)
+    cfg.VerboseExecutePreprocessor.memory_limit      = memory_limit
+    cfg.VerboseExecutePreprocessor.track_memory      = track_memory
+    cfg.VerboseExecutePreprocessor.max_stream_output = max_stream
+    cfg.VerboseExecutePreprocessor.max_cell_output   = max_cell
+    cfg.CachedHTMLExporter.template_cache            = template_cache
+    if getattr(options, 'citation_cache', False):
+        try:
+            cfg.AddCitationsPreprocessor.cache_file = os.path.join(
+                cache_dir(), 'citations.sqlite')
+        except OSError as e:
+            get_logger().warning('Citation cache disabled: %s', e)
+    if basename is not None and getattr(options, 'spill_outputs', False):
+        spill_dir = basename + '_outputs'
+        cfg.VerboseExecutePreprocessor.spill_dir = spill_dir
+        cfg.VerboseExecutePreprocessor.spill_url = os.path.basename(spill_dir)
+    return cfg
+
+################################################################################
+
+def _export(notebook, options, events, resources=None, basename=None):
+    """
+    Execute the given notebook, add its citations and convert it to HTML,
+    returning a tuple of the HTML body and the resources. The basename of the
+    HTML file, if given, locates the spilled outputs (see _configure()).
+    """
+
+    # Configure the HTMLExporter to use the preprocessors
+    cfg = _configure(options, basename)
+    cfg.HTMLExporter.preprocessors = [
+        VerboseExecutePreprocessor(config=cfg, events=events),
+        AddCitationsPreprocessor(config=cfg, events=events)]
 
     # Convert the notebook to HTML
-    html_exporter = HTMLExporter(config=cfg)
-    if options.verbose:
-        print('Converting "%s" to HTML' % filename)
-    (body, resources) = html_exporter.from_notebook_node(notebook)
+    html_exporter = CachedHTMLExporter(config=cfg)
+    events.emit('conversion_started')
+    return html_exporter.from_notebook_node(notebook, resources)
 
-    # Output
+################################################################################
+
+def _write(body, resources, basename, options, events):
+    """
+    Write the given HTML body and resources to <basename>.html
+    """
     writer = FilesWriter()
-    if options.verbose:
-        print('Writing "%s.html"' % basename)
-    writer.write(body, resources, notebook_name=basename)
+    output = writer.write(body, resources, notebook_name=basename)
+    events.emit('file_written', filename=output, size=os.path.getsize(output))
+
+################################################################################
 
+def convert(filename, options, events=None):
+    """
+    Take as input a filename for a Jupyter Notebook (and a variety of options)
+    and write an HTML file that is a representation of that notebook. Progress
+    events are reported to the given nbref.Events object, if any.
+    """
+
+    # Open the Jupyter notebook
+    start  = time.time()
+    events = _events(filename, options, events)
+    (basename, notebook) = _read(filename, options, events)
+
+    # Convert the notebook to HTML
+    (body, resources) = _export(notebook, options, events, basename=basename)
+
+    # Output
+    _write(body, resources, basename, options, events)
+    events.emit('notebook_finished', duration=time.time() - start)
@@ -0,0 +1,104 @@
+################################################################################
+
+# Module imports
+import asyncio
+import time
+
+################################################################################
+
+# Local imports
+from .AddCitationsPreprocessor   import AddCitationsPreprocessor
+from .VerboseExecutePreprocessor import VerboseExecutePreprocessor
+from .CachedHTMLExporter         import CachedHTMLExporter
+from .convert                    import _configure
+from .convert                    import _events
+from .convert                    import _read
+from .convert                    import _write
+
+################################################################################
+
+def _render(cfg, notebook, resources, events):
+    """
+    Convert the given notebook, already executed and with its citations added,
+    to HTML and return a tuple of the HTML body and the resources
+    """
+    # The preprocessors have already been applied, so make sure the exporter
+    # does not execute the notebook again
+    cfg.ExecutePreprocessor.enabled = False
+    cfg.HTMLExporter.preprocessors  = []
+    html_exporter = CachedHTMLExporter(config=cfg)
+    events.emit('conversion_started')
+    return html_exporter.from_notebook_node(notebook, resources)
+
+################################################################################
+
+async def _convert(filename, options, events):
+    """
+    Coroutine that performs the conversion for convert_async(). Reading and
+    validating the notebook, rendering the HTML and writing it are blocking
+    steps, so they are run in the default executor.
+    """
+    loop = asyncio.get_running_loop()
+
+    # Open the Jupyter notebook
+    start  = time.time()
+    events = _events(filename, options, events)
+    (basename, notebook) = await loop.run_in_executor(None, _read, filename,
+                                                      options, events)
+
+    # Execute the notebook and add the citations without blocking the event
+    # loop
+    cfg = _configure(options, basename)
+    resources = {}
+    execute   = VerboseExecutePreprocessor(config=cfg, events=events)
+    citations = AddCitationsPreprocessor(config=cfg, events=events)
+    (notebook, resources) = await execute.async_preprocess(notebook, resources)
+    (notebook, resources) = await citations.async_preprocess(notebook,
+                                                             resources)
+
+    # Convert the notebook to HTML
+    (body, resources) = await loop.run_in_executor(None, _render, cfg,
+                                                   notebook, resources, events)
+
+    # Output
+    await loop.run_in_executor(None, _write, body, resources, basename,
+                               options, events)
+    events.emit('notebook_finished', duration=time.time() - start)
+
+################################################################################
+
+async def _cancel(task):
+    """
+    Cancel the given task and wait for it to finish cleaning up. nbclient
+    reports a cancelled cell execution as a DeadKernelError, so any exception
+    raised by the task while it is being cancelled is ignored.
+    """
+    task.cancel()
+    try:
+        await task
+    except (asyncio.CancelledError, Exception):
+        pass
+
+################################################################################
+
+async def convert_async(filename, options, timeout=None, events=None):
+    """
+    Asynchronous version of convert(). The notebook is executed with the
+    asynchronous kernel client and pandoc is run as an asyncio subprocess, so
+    many conversions can be multiplexed on one event loop without a thread per
+    conversion. If timeout (in seconds) is given and the conversion takes
+    longer, asyncio.TimeoutError is raised. On timeout or cancellation the
+    kernel is shut down and any running pandoc process is killed. Progress
+    events are reported to the given nbref.Events object, if any.
+    """
+    task = asyncio.ensure_future(_convert(filename, options, events))
+    try:
+        (done, pending) = await asyncio.wait([task], timeout=timeout)
+    except asyncio.CancelledError:
+        await _cancel(task)
+        raise
+    if pending:
+        await _cancel(task)
+        raise asyncio.TimeoutError('Converting "%s" took longer than %s s' %
+                                   (filename, timeout))
+    task.result()
@@ -0,0 +1,178 @@
+################################################################################
+
+# Module imports
+import json
+import threading
+import time
+
+################################################################################
+
+class Events(object):
+    """
+    A simple publish/subscribe hub for structured progress events. Callbacks
+    registered with subscribe() are called with a single dictionary argument,
+    the event record, which always contains the keys
+
+        event - The name of the event, such as 'cell_executed'
+        time  - The time the event was emitted, in seconds since the epoch
+
+    plus any context given to the constructor (for example the notebook name)
+    and the data given to emit(). Records are also passed to the subscribers
+    of the parent Events object, if any, so that per-notebook Events can add
+    context while reporting to a single batch-wide hub.
+
+    The events emitted by nbref are
+
+        notebook_started   - notebook
+        notebook_loaded    - notebook, duration, backend, validated
+        execution_started  - notebook
+        cell_executed      - notebook, index, cell_type, duration
+        kernel_memory      - notebook, peak, killed
+        citations_found    - notebook, count, citations
+        pandoc_started     - notebook, csl, bibliography
+        pandoc_finished    - notebook, duration
+        citations_reused   - notebook, csl, bibliography
+        conversion_started - notebook
+        file_written       - notebook, filename, size
+        notebook_finished  - notebook, duration
+        notebook_failed    - notebook, error
+        notebook_admitted  - notebook, expected_memory, memory_in_use
+    """
+
+    def __init__(self, parent=None, **context):
+        """
+        Initialize with no subscribers
+        """
+        self.callbacks = []
+        self.parent    = parent
+        self.context   = context
+
+    ############################################################################
+
+    def __deepcopy__(self, memo):
+        """
+        An Events object is a shared channel, so copies are the object itself.
+        nbconvert deep-copies its configuration, which holds the preprocessors
+        and therefore their Events, and copying the subscribers (open log
+        files, queue proxies, ...) would fail or disconnect them.
+        """
+        return self
+
+    ############################################################################
+
+    def subscribe(self, callback):
+        """
+        Call the given callback for every event. Subscribing the same callback
+        more than once has no further effect.
+        """
+        if callback not in self.callbacks:
+            self.callbacks.append(callback)
+
+    ############################################################################
+
+    def unsubscribe(self, callback):
+        """
+        Stop calling the given callback
+        """
+        if callback in self.callbacks:
+            self.callbacks.remove(callback)
+
+    ############################################################################
+
+    def subscribed(self, callback):
+        """
+        Return True if the given callback is subscribed to this object or to
+        any of its parents
+        """
+        events = self
+        while events is not None:
+            if callback in events.callbacks:
+                return True
+            events = events.parent
+        return False
+
+    ############################################################################
+
+    def emit(self, event, **data):
+        """
+        Build an event record from the given event name and data, pass it to
+        every subscriber and return it
+        """
+        record = {'event': event, 'time': time.time()}
+        record.update(self.context)
+        record.update(data)
+        self.dispatch(record)
+        return record
+
+    ############################################################################
+
+    def dispatch(self, record):
+        """
+        Pass an already built event record to every subscriber, and to the
+        subscribers of the parent
+        """
+        for callback in list(self.callbacks):
+            callback(record)
+        if self.parent is not None:
+            self.parent.dispatch(record)
+
+################################################################################
+
+def print_event(record):
+    """
+    An Events subscriber that prints the verbose progress messages of nbref
+    """
+    event = record['event']
+    if event == 'notebook_started':
+        print('Reading "%s"' % record['notebook'])
+    elif event == 'execution_started':
+        print('    Executing notebook...')
+    elif event == 'citations_found':
+        if record['count'] == 1:
+            print('    1 citation found')
+        else:
+            print('    %d citations found' % record['count'])
+    elif event == 'pandoc_started':
+        print('    Citation Style Language = "%s"' % record['csl']         )
+        print('    BibTeX reference file   = "%s"' % record['bibliography'])
+    elif event == 'citations_reused':
+        print('    Citation Style Language = "%s"' % record['csl']         )
+        print('    BibTeX reference file   = "%s"' % record['bibliography'])
+        print('    Reusing cached citations')
+    elif event == 'conversion_started':
+        print('Converting "%s" to HTML' % record['notebook'])
+    elif event == 'file_written':
+        print('Wrote "%s" (%d bytes)' % (record['filename'], record['size']))
+
+################################################################################
+
+class JsonLinesLog(object):
+    """
+    An Events subscriber that appends every event record as one line of JSON to
+    the given file. The file is opened in append mode and every record is
+    written and flushed with a single write, so several processes may share
+    one log.
+    """
+
+    def __init__(self, filename):
+        """
+        Open the log file
+        """
+        self.filename = filename
+        self._file    = open(filename, 'a')
+        self._lock    = threading.Lock()
+
+    def __call__(self, record):
+        """
+        Write the given event record
+        """
+        line = json.dumps(record, sort_keys=True, default=str) + '\n'
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+
+    def close(self):
+        """
+        Close the log file
+        """
+        self._file.close()
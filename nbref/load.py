@@ -0,0 +1,120 @@
+################################################################################
+
+# Module imports
+import hashlib
+import json
+import os
+import time
+
+import nbformat
+
+################################################################################
+
+# Optional fast JSON backends, in order of preference
+try:
+    import orjson
+    json_backend = 'orjson'
+    json_loads   = orjson.loads
+except ImportError:
+    try:
+        import ujson
+        json_backend = 'ujson'
+        json_loads   = ujson.loads
+    except ImportError:
+        json_backend = 'json'
+        json_loads   = json.loads
+
+################################################################################
+
+# Object imports
+from traitlets.log import get_logger
+
+################################################################################
+
+# Local imports
+from .cache import cache_dir
+
+################################################################################
+
+# Aliases and global variables
+ValidationError = nbformat.ValidationError
+validate_modes  = ['always', 'new', 'never']
+
+################################################################################
+
+def _validated_marker(digest):
+    """
+    Return the name of the marker file recording that the notebook with the
+    given content hash has already passed validation
+    """
+    return os.path.join(cache_dir('validated'), digest)
+
+################################################################################
+
+def load_notebook(filename, validate='always', events=None):
+    """
+    Read the given Jupyter notebook file and return it as a version 4
+    NotebookNode. This is equivalent to nbformat.reads(..., as_version=4), but
+    parses the JSON with orjson or ujson when either is installed, and only
+    validates the notebook against the nbformat schema according to the given
+    validate mode:
+
+        always - Validate every notebook (the nbformat behavior)
+        new    - Validate only notebooks whose content has not passed
+                 validation before, as recorded by content hash in the nbref
+                 cache directory
+        never  - Skip validation
+
+    As with nbformat.reads(), validation errors are logged rather than raised.
+    If an nbref.Events object is given, a notebook_loaded event is emitted with
+    the load time, the JSON backend and whether the notebook was validated.
+    """
+    start = time.time()
+    with open(filename, 'rb') as notebook_file:
+        data = notebook_file.read()
+    return reads_notebook(data, validate, events, start)
+
+################################################################################
+
+def reads_notebook(data, validate='always', events=None, start=None):
+    """
+    Version of load_notebook() that takes the contents of the notebook file as
+    bytes. If given, start is the time at which loading began, for the
+    notebook_loaded event.
+    """
+    if validate not in validate_modes:
+        raise ValueError('validate must be one of %s' % validate_modes)
+    if start is None:
+        start = time.time()
+
+    # Parse the JSON and convert it to a version 4 NotebookNode
+    try:
+        nb_dict = json_loads(data)
+    except ValueError:
+        raise nbformat.reader.NotJSONError('Notebook does not appear to be '
+                                           'JSON')
+    (major, minor) = nbformat.reader.get_version(nb_dict)
+    if major not in nbformat.versions:
+        raise nbformat.NBFormatError('Unsupported nbformat version %s' % major)
+    notebook = nbformat.versions[major].to_notebook_json(nb_dict, minor=minor)
+    notebook = nbformat.convert(notebook, 4)
+
+    # Validate the notebook, if requested
+    marker = None
+    if validate == 'new':
+        marker = _validated_marker(hashlib.sha1(data).hexdigest())
+        validated = not os.path.exists(marker)
+    else:
+        validated = validate == 'always'
+    if validated:
+        try:
+            nbformat.validate(notebook)
+            if marker is not None:
+                open(marker, 'w').close()
+        except ValidationError as e:
+            get_logger().error('Notebook JSON is invalid: %s', e)
+
+    if events is not None:
+        events.emit('notebook_loaded', duration=time.time() - start,
+                    backend=json_backend, validated=validated)
+    return notebook
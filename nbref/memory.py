@@ -0,0 +1,129 @@
+################################################################################
+
+# Module imports
+import os
+import signal
+import sys
+import threading
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+################################################################################
+
+def process_rss(pid):
+    """
+    Return the resident set size, in bytes, of the process with the given pid
+    and all of its descendants, or None if it cannot be determined. psutil is
+    used if it is installed; otherwise /proc is read, which is only available
+    on Linux and does not include descendants.
+    """
+    if psutil is not None:
+        try:
+            process = psutil.Process(pid)
+            total = process.memory_info().rss
+            for child in process.children(recursive=True):
+                try:
+                    total += child.memory_info().rss
+                except psutil.Error:
+                    pass
+            return total
+        except psutil.Error:
+            return None
+    try:
+        with open('/proc/%d/status' % pid) as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except (IOError, OSError, ValueError):
+        pass
+    return None
+
+################################################################################
+
+def memory_measurable():
+    """
+    Return True if process_rss() can measure the memory of processes on this
+    system
+    """
+    return process_rss(os.getpid()) is not None
+
+################################################################################
+
+def peak_rss():
+    """
+    Return the peak resident set size of this process in bytes, or 0 if it
+    cannot be determined
+    """
+    if resource is None:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    if sys.platform == 'darwin':
+        return peak
+    return peak * 1024
+
+################################################################################
+
+def kernel_pid(km):
+    """
+    Return the process id of the kernel started by the given kernel manager,
+    or None if it is not known
+    """
+    provisioner = getattr(km, 'provisioner', None)
+    pid = getattr(provisioner, 'pid', None)
+    if pid is None:
+        pid = getattr(getattr(km, 'kernel', None), 'pid', None)
+    return pid
+
+################################################################################
+
+class MemoryWatchdog(threading.Thread):
+    """
+    A daemon thread that samples the memory use of a process every interval
+    seconds, recording its peak, and kills the process if it exceeds limit
+    bytes (a limit of 0 means no limit). It has the following attributes:
+
+        peak     - The largest resident set size observed, in bytes
+        measured - True once the memory of the process has been sampled, so
+                   that peak is meaningful
+        exceeded - True if the process was killed for exceeding the limit
+    """
+
+    def __init__(self, pid, limit=0, interval=0.2):
+        threading.Thread.__init__(self)
+        self.daemon   = True
+        self.pid      = pid
+        self.limit    = limit
+        self.interval = interval
+        self.peak     = 0
+        self.measured = False
+        self.exceeded = False
+        self.stopped  = threading.Event()
+
+    def run(self):
+        while not self.stopped.is_set():
+            rss = process_rss(self.pid)
+            if rss is None:
+                return
+            self.measured = True
+            self.peak = max(self.peak, rss)
+            if self.limit and rss > self.limit:
+                self.exceeded = True
+                try:
+                    os.kill(self.pid, getattr(signal, 'SIGKILL', signal.SIGTERM))
+                except OSError:
+                    pass
+                return
+            self.stopped.wait(self.interval)
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
@@ -0,0 +1,231 @@
+################################################################################
+
+# Module imports
+import io
+import os
+
+import nbformat
+
+################################################################################
+
+# Aliases and global variables
+new_output = nbformat.v4.new_output
+
+################################################################################
+
+def _truncate(text, limit):
+    """
+    Return the given text shortened to about limit characters by replacing its
+    middle with a marker, keeping its head and tail
+    """
+    if limit <= 0 or len(text) <= limit:
+        return text
+    head = limit - limit // 2
+    tail = limit // 2
+    omitted = len(text) - head - tail
+    return (text[:head] + '\n... [%d characters omitted] ...\n' % omitted +
+            text[len(text) - tail:])
+
+################################################################################
+
+class _Stream(object):
+    """
+    The state of one output stream (stdout or stderr) of a cell being capped
+    """
+
+    def __init__(self):
+        self.total      = 0      # Characters received
+        self.head       = 0      # Characters kept in the cell outputs
+        self.tail       = ''     # The most recent characters not kept
+        self.seen       = []     # Text kept so far, copied to a spill file
+        self.overflowed = False
+        self.spill      = None   # The spill file, once overflowed
+        self.spill_name = None
+
+################################################################################
+
+class OutputLimiter(object):
+    """
+    Keep the outputs of one executing cell within limits, as the kernel sends
+    them, so memory use and output size stay bounded whatever the cell prints.
+    It has the following attributes:
+
+        max_stream - The maximum number of characters kept for each output
+                     stream (stdout, stderr) of the cell: the first half and
+                     the last half of the stream are kept (0 for no limit)
+        max_cell   - The maximum number of characters kept for all the
+                     outputs of the cell; once reached, further stream text
+                     only feeds the tail of its stream and other outputs are
+                     dropped (0 for no limit)
+        spill_dir  - If not empty, the directory in which the full text of
+                     every truncated stream is written, as
+                     cell<index>_<stream>.txt
+        spill_url  - The URL of spill_dir relative to the HTML file, used to
+                     link the spill files from the notebook
+
+    Tracebacks of error outputs are truncated to max_stream (or max_cell)
+    characters, keeping their head and tail.
+    """
+
+    def __init__(self, cell_index, max_stream=0, max_cell=0, spill_dir='',
+                 spill_url=''):
+        self.cell_index = cell_index
+        self.max_stream = max_stream
+        self.max_cell   = max_cell
+        self.spill_dir  = spill_dir
+        self.spill_url  = spill_url
+        self.kept       = 0
+        self.dropped    = 0
+        self.streams    = {}
+
+    ############################################################################
+
+    def _cell_room(self):
+        """
+        Return the number of characters that may still be kept for the cell, or
+        None for no limit
+        """
+        if not self.max_cell:
+            return None
+        return max(self.max_cell - self.kept, 0)
+
+    ############################################################################
+
+    def _record(self, stream, text):
+        """
+        Copy the given kept text of the given stream to its spill file, or keep
+        it aside until the stream overflows, if spilling
+        """
+        if stream.spill is not None:
+            stream.spill.write(text)
+        elif self.spill_dir:
+            stream.seen.append(text)
+
+    ############################################################################
+
+    def _overflow(self, name, stream):
+        """
+        Mark the given stream as overflowed and, if spilling, open its spill
+        file (unless it is still open from before the outputs were cleared) and
+        copy the text kept so far into it
+        """
+        stream.overflowed = True
+        if self.spill_dir and stream.spill is None:
+            if not os.path.isdir(self.spill_dir):
+                os.makedirs(self.spill_dir)
+            stream.spill_name = 'cell%d_%s.txt' % (self.cell_index, name)
+            stream.spill = io.open(os.path.join(self.spill_dir,
+                                                stream.spill_name),
+                                   'w', encoding='utf-8')
+            stream.spill.write(u''.join(stream.seen))
+        stream.seen = []
+
+    ############################################################################
+
+    def stream_text(self, name, text):
+        """
+        Account for the given text received on the given stream, and return
+        the part of it to keep in the cell outputs now (possibly empty)
+        """
+        stream = self.streams.setdefault(name, _Stream())
+        stream.total += len(text)
+        if not stream.overflowed:
+            room = self._cell_room()
+            if self.max_stream:
+                head_room = self.max_stream - self.max_stream // 2 - stream.head
+                room = head_room if room is None else min(room, head_room)
+            if room is None or len(text) <= room:
+                stream.head += len(text)
+                self.kept   += len(text)
+                self._record(stream, text)
+                return text
+            keep = text[:room]
+            stream.head += len(keep)
+            self.kept   += len(keep)
+            self._record(stream, keep)
+            self._overflow(name, stream)
+            text = text[room:]
+        else:
+            keep = ''
+        if stream.spill is not None:
+            stream.spill.write(text)
+        tail_limit = (self.max_stream or self.max_cell) // 2
+        if tail_limit:
+            stream.tail = (stream.tail + text)[-tail_limit:]
+        return keep
+
+    ############################################################################
+
+    def keep_output(self, size):
+        """
+        Return True if a non-stream output of the given size (in characters)
+        may be kept in the cell outputs
+        """
+        room = self._cell_room()
+        if room is not None and size > room:
+            self.dropped += 1
+            return False
+        self.kept += size
+        return True
+
+    ############################################################################
+
+    def traceback(self, lines):
+        """
+        Return the given list of traceback lines truncated to the limit
+        """
+        limit = self.max_stream or self.max_cell
+        if not limit or sum([len(line) for line in lines]) <= limit:
+            return lines
+        return _truncate(u'\n'.join(lines), limit).split(u'\n')
+
+    ############################################################################
+
+    def clear(self):
+        """
+        Forget the outputs kept so far, after the outputs of the cell have been
+        cleared. Open spill files are kept, so each stream of the cell has a
+        single spill file holding all of its text.
+        """
+        self.kept    = 0
+        self.dropped = 0
+        for (name, stream) in self.streams.items():
+            fresh = _Stream()
+            fresh.spill      = stream.spill
+            fresh.spill_name = stream.spill_name
+            self.streams[name] = fresh
+
+    ############################################################################
+
+    def finish(self):
+        """
+        Close any spill files and return a list of outputs to append to the
+        cell: the tail of every truncated stream, preceded by a marker and
+        followed by a link to its spill file, and a note on dropped outputs
+        """
+        outputs = []
+        for name in sorted(self.streams.keys()):
+            stream = self.streams[name]
+            if not stream.overflowed:
+                if stream.spill is not None:
+                    stream.spill.close()
+                continue
+            omitted = stream.total - stream.head - len(stream.tail)
+            text = stream.tail
+            if omitted > 0:
+                text = u'\n... [%d characters omitted] ...\n' % omitted + text
+            outputs.append(new_output('stream', name=name, text=text))
+            if stream.spill is not None:
+                stream.spill.close()
+                url = stream.spill_name
+                if self.spill_url:
+                    url = self.spill_url + '/' + url
+                outputs.append(new_output('display_data', data={
+                    'text/html' : u'<a href="%s">Full %s output</a>' %
+                                  (url, name),
+                    'text/plain': u'Full %s output: %s' % (name, url)}))
+        if self.dropped:
+            outputs.append(new_output('stream', name='stderr',
+                                      text=u'... [%d outputs omitted] ...\n' %
+                                      self.dropped))
+        return outputs
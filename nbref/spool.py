@@ -0,0 +1,333 @@
+"""
+A spool directory is a work queue that may be shared between several hosts
+(for example over NFS). Every job is a directory holding one notebook, plus any
+files it needs such as its BibTeX database, and moves between the following
+subdirectories of the spool with atomic renames:
+
+    tmp/<job>                 - A job being assembled by submit()
+    incoming/<job>            - A job waiting to be claimed
+    claimed/<job>@<worker>    - A job being converted by a worker. The mtime of
+                                its .lease file is refreshed while the worker
+                                is alive
+    tmp/<job>@<worker>        - The worker's private copy of a claimed job, in
+                                which the notebook is converted
+    done/<job>, failed/<job>  - A finished job, including the HTML output and a
+                                status.json record
+
+Only one worker can win the rename of incoming/<job>, so a job is never
+converted twice concurrently. A claim whose lease has not been refreshed for
+longer than the lease time is assumed to belong to a crashed worker, and is
+renamed back to incoming/<job>. A worker only moves its outputs into the job
+if it still holds the claim when the conversion ends, so a worker whose claim
+was requeued never writes into a job that another worker may be converting.
+Lease expiry compares file mtimes with the local clock, so the lease time
+should be much longer than any clock skew between hosts.
+
+A job.json manifest records the options the job was submitted with (see
+JOB_OPTIONS), which take precedence over the options of the worker.
+"""
+
+################################################################################
+
+# Module imports
+import copy
+import json
+import os
+import shutil
+import socket
+import threading
+import time
+import traceback
+import uuid
+
+################################################################################
+
+# Local imports
+from .convert import convert
+
+################################################################################
+
+# Aliases and global variables
+INCOMING  = 'incoming'
+CLAIMED   = 'claimed'
+DONE      = 'done'
+FAILED    = 'failed'
+TMP       = 'tmp'
+LEASE     = '.lease'
+STATUS    = 'status.json'
+MANIFEST  = 'job.json'
+separator = '@'
+
+# Options recorded in the job manifest, so that workers convert a job the way
+# its submitter would have
+JOB_OPTIONS = ['bib', 'csl', 'header', 'kernel', 'timeout']
+
+################################################################################
+
+def _makedirs(spool_dir):
+    """
+    Create the subdirectories of the given spool directory, if necessary
+    """
+    for subdir in [TMP, INCOMING, CLAIMED, DONE, FAILED]:
+        path = os.path.join(spool_dir, subdir)
+        if not os.path.isdir(path):
+            try:
+                os.makedirs(path)
+            except OSError:
+                if not os.path.isdir(path):
+                    raise
+
+################################################################################
+
+def _worker_id():
+    """
+    Return an identifier for this worker process that is unique across hosts
+    """
+    host = socket.gethostname().replace(separator, '_')
+    return '%s.%d' % (host, os.getpid())
+
+################################################################################
+
+def submit(spool_dir, filename, extra_files=(), options=None):
+    """
+    Add the given notebook to the given spool directory as a new job, along
+    with the given list of extra files (such as its BibTeX database), which are
+    copied into the job directory. If options are given, the values of
+    JOB_OPTIONS are recorded in the job manifest, with the BibTeX file referred
+    to by its basename, and the CSL file is copied into the job if it is found
+    on options.csl_path. Return the job name.
+    """
+    _makedirs(spool_dir)
+    basename = os.path.splitext(os.path.basename(filename))[0]
+    job = '%s-%s' % (basename.replace(separator, '_'), uuid.uuid4().hex[:12])
+    tmp = os.path.join(spool_dir, TMP, job)
+    os.mkdir(tmp)
+    shutil.copy(filename, tmp)
+    for extra in extra_files:
+        shutil.copy(extra, tmp)
+    if options is not None:
+        manifest = dict([(name, getattr(options, name))
+                         for name in JOB_OPTIONS])
+        manifest['bib'] = os.path.basename(options.bib)
+        for path in options.csl_path:
+            csl_file = os.path.join(path, options.csl)
+            if os.path.isfile(csl_file):
+                shutil.copy(csl_file, tmp)
+                manifest['csl'] = os.path.basename(csl_file)
+                break
+        with open(os.path.join(tmp, MANIFEST), 'w') as manifest_file:
+            json.dump(manifest, manifest_file, indent=1, sort_keys=True)
+    os.rename(tmp, os.path.join(spool_dir, INCOMING, job))
+    return job
+
+################################################################################
+
+def _lease_age(path, now):
+    """
+    Return the number of seconds since the lease of the given claimed job
+    directory was last refreshed
+    """
+    lease = os.path.join(path, LEASE)
+    if os.path.exists(lease):
+        return now - os.stat(lease).st_mtime
+    # The worker has renamed the job but not yet written its lease
+    stat = os.stat(path)
+    return now - max(stat.st_mtime, stat.st_ctime)
+
+################################################################################
+
+def reap_stale(spool_dir, lease):
+    """
+    Return every claimed job in the given spool directory whose lease is older
+    than the given number of seconds to the incoming queue. Return the list of
+    job names that were requeued.
+    """
+    requeued = []
+    claimed  = os.path.join(spool_dir, CLAIMED)
+    now      = time.time()
+    for entry in os.listdir(claimed):
+        path = os.path.join(claimed, entry)
+        try:
+            if _lease_age(path, now) <= lease:
+                continue
+            job = entry.rsplit(separator, 1)[0]
+            os.rename(path, os.path.join(spool_dir, INCOMING, job))
+        except OSError:
+            # The job finished or another worker reaped it first
+            continue
+        requeued.append(job)
+    return requeued
+
+################################################################################
+
+def _claim(spool_dir, worker):
+    """
+    Atomically claim the next job in the incoming queue of the given spool
+    directory. Return a tuple of the job name and the claimed directory, or
+    None if the queue is empty.
+    """
+    incoming = os.path.join(spool_dir, INCOMING)
+    for job in sorted(os.listdir(incoming)):
+        path = os.path.join(spool_dir, CLAIMED, job + separator + worker)
+        try:
+            os.rename(os.path.join(incoming, job), path)
+        except OSError:
+            # Another worker claimed it first
+            continue
+        with open(os.path.join(path, LEASE), 'w') as lease_file:
+            lease_file.write(worker + '\n')
+        return (job, path)
+    return None
+
+################################################################################
+
+class _Heartbeat(threading.Thread):
+    """
+    A daemon thread that refreshes the mtime of a lease file every interval
+    seconds until stopped. If the lease file is gone, the claim was reaped:
+    the lost attribute is set and the thread stops.
+    """
+
+    def __init__(self, lease_file, interval):
+        threading.Thread.__init__(self)
+        self.daemon     = True
+        self.lease_file = lease_file
+        self.interval   = interval
+        self.stopped    = threading.Event()
+        self.lost       = False
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                os.utime(self.lease_file, None)
+            except OSError:
+                # The claim was reaped; the result will be discarded
+                self.lost = True
+                return
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+################################################################################
+
+def _job_options(options):
+    """
+    Return a copy of the given worker options, updated with the job manifest
+    in the current directory, if there is one
+    """
+    if not os.path.isfile(MANIFEST):
+        return options
+    with open(MANIFEST) as manifest_file:
+        manifest = json.load(manifest_file)
+    options = copy.copy(options)
+    for name in JOB_OPTIONS:
+        if name in manifest:
+            setattr(options, name, manifest[name])
+    # A CSL file copied into the job is found first
+    options.csl_path = ['.'] + [path for path in options.csl_path
+                                if path != '.']
+    return options
+
+################################################################################
+
+def _run_job(spool_dir, job, path, worker, options, lease, events):
+    """
+    Convert the notebook of the given claimed job directory in a private copy
+    of the job. If the claim is still held once the conversion has finished,
+    move the outputs into the job directory, write its status record, move the
+    job to the done or failed directory and return the name of that directory
+    (DONE or FAILED). Return None if the claim was lost, in which case the
+    result is discarded and the job is left to another worker.
+    """
+    heartbeat = _Heartbeat(os.path.join(path, LEASE), max(lease / 3.0, 0.1))
+    heartbeat.start()
+    inputs = [f for f in os.listdir(path) if f != LEASE]
+    notebooks = sorted([f for f in inputs if f.endswith('.ipynb')])
+    status = {'job'     : job,
+              'worker'  : worker,
+              'notebook': notebooks[0] if notebooks else None,
+              'start'   : time.time()}
+    scratch = os.path.join(spool_dir, TMP, job + separator + worker)
+    curdir = os.getcwd()
+    try:
+        # Convert inside a copy of the job directory, so that relative BibTeX
+        # paths and notebook data files resolve against the submitted files,
+        # and nothing is written into the claim if it is requeued meanwhile
+        shutil.copytree(path, scratch, ignore=shutil.ignore_patterns(LEASE))
+        os.chdir(scratch)
+        if not notebooks:
+            raise IOError('No notebook found in job "%s"' % job)
+        convert(notebooks[0], _job_options(options), events)
+        status['error'] = None
+    except Exception as e:
+        if options.debug:
+            status['error'] = traceback.format_exc()
+        else:
+            status['error'] = str(e)
+    finally:
+        os.chdir(curdir)
+        heartbeat.stop()
+    status['end']     = time.time()
+    status['elapsed'] = status['end'] - status['start']
+    succeeded = status['error'] is None
+    destination = os.path.join(spool_dir, DONE if succeeded else FAILED, job)
+    try:
+        # Our lease expired and the job was requeued; discard this result.
+        # Otherwise the renames below fail if the claim is reaped meanwhile.
+        if heartbeat.lost or not os.path.isdir(path):
+            return None
+        outputs = []
+        if os.path.isdir(scratch):
+            outputs = sorted(set(os.listdir(scratch)) - set(inputs))
+        for output in outputs:
+            os.rename(os.path.join(scratch, output),
+                      os.path.join(path, output))
+        status['outputs'] = outputs
+        with open(os.path.join(path, STATUS), 'w') as status_file:
+            json.dump(status, status_file, indent=1, sort_keys=True)
+        os.remove(os.path.join(path, LEASE))
+        os.rename(path, destination)
+    except OSError:
+        return None
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+    if options.verbose:
+        print('Job "%s" %s' % (job, 'done' if succeeded else 'failed'))
+    return DONE if succeeded else FAILED
+
+################################################################################
+
+def run_worker(spool_dir, options, lease=300.0, poll=1.0, wait=False,
+               events=None):
+    """
+    Run a worker that repeatedly claims a job from the given spool directory,
+    converts it with nbref.convert() and records its result, until no work is
+    left (or forever, if wait is True). Claims held by other workers whose
+    leases are older than the given number of seconds are requeued. Progress
+    events are reported to the given nbref.Events object, if any. Return a
+    tuple of the number of jobs that succeeded, that failed, and whose claims
+    were lost and requeued before their conversion finished.
+    """
+    _makedirs(spool_dir)
+    worker = _worker_id()
+    (succeeded, failed, requeued) = (0, 0, 0)
+    while True:
+        reap_stale(spool_dir, lease)
+        claim = _claim(spool_dir, worker)
+        if claim is None:
+            # Keep polling while other workers hold claims, in case they crash
+            claimed = os.listdir(os.path.join(spool_dir, CLAIMED))
+            if not (wait or claimed):
+                break
+            time.sleep(poll)
+            continue
+        result = _run_job(spool_dir, claim[0], claim[1], worker, options,
+                          lease, events)
+        if result == DONE:
+            succeeded += 1
+        elif result == FAILED:
+            failed += 1
+        else:
+            requeued += 1
+    return (succeeded, failed, requeued)
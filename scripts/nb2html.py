@@ -13,11 +13,13 @@ import argparse
 import glob
 import os
 import sys
+import time
 
 ################################################################################
 
 # NBREF import
 import nbref
+import nbref.spool
 
 ################################################################################
 
@@ -120,7 +122,7 @@ if __name__ == "__main__":
                         metavar='FILE',
                         type=str,
                         nargs='*',
-                        help='Jupyter notebook filename(s) to be processed')
+                        help='Jupyter notebook filename(s) to be processed, or archive(s) of notebooks with --archive-out')
     parser.add_argument('--kernel',
                         dest='kernel',
                         choices=['python2','python3'],
@@ -171,6 +173,102 @@ if __name__ == "__main__":
                         dest='csl_path',
                         action=append_list,
                         help='append a comma-separated list of path names to the CSL path name list')
+    parser.add_argument('--archive-out',
+                        dest='archive_out',
+                        type=str,
+                        default=None,
+                        help='treat FILE(s) as zip or tar archives of notebooks and write the HTML files into this zip or tar archive')
+    parser.add_argument('--validate',
+                        dest='validate',
+                        choices=nbref.load.validate_modes,
+                        default='always',
+                        help='when to validate notebooks against the nbformat schema: always, only notebooks not validated before (new), or never')
+    parser.add_argument('--no-template-cache',
+                        dest='template_cache',
+                        action='store_false',
+                        default=True,
+                        help='do not cache compiled HTML templates in the nbref cache directory')
+    parser.add_argument('--no-citation-cache',
+                        dest='citation_cache',
+                        action='store_false',
+                        default=True,
+                        help='do not cache the citations of each cell and their formatted text in the nbref cache directory')
+    parser.add_argument('-j',
+                        '--jobs',
+                        dest='jobs',
+                        type=int,
+                        default=1,
+                        help='number of notebooks to convert in parallel')
+    parser.add_argument('--history',
+                        dest='history',
+                        type=str,
+                        default=None,
+                        help='execution history database used to schedule the longest notebooks first (default <cache-dir>/history.sqlite, used only with --jobs > 1 or --report unless given)')
+    parser.add_argument('--no-history',
+                        dest='use_history',
+                        action='store_false',
+                        default=True,
+                        help='do not record or use the execution history')
+    parser.add_argument('--memory-budget',
+                        dest='memory_budget',
+                        type=float,
+                        default=None,
+                        help='total memory (in MB) that concurrent conversions may be expected to use; notebooks are only started while their expected memory fits')
+    parser.add_argument('--memory-limit',
+                        dest='memory_limit_mb',
+                        type=float,
+                        default=0,
+                        help='memory (in MB) above which a notebook kernel is killed and its conversion reported as failed (0 for no limit)')
+    parser.add_argument('--max-stream-output',
+                        dest='max_stream_output',
+                        type=int,
+                        default=0,
+                        help='maximum number of characters kept for each output stream of a cell, half from its start and half from its end (0 for no limit)')
+    parser.add_argument('--max-cell-output',
+                        dest='max_cell_output',
+                        type=int,
+                        default=0,
+                        help='maximum number of characters kept for all the outputs of a cell (0 for no limit)')
+    parser.add_argument('--spill-outputs',
+                        dest='spill_outputs',
+                        action='store_true',
+                        default=False,
+                        help='write the full text of truncated output streams to files in <notebook>_outputs/, linked from the HTML')
+    parser.add_argument('--report',
+                        dest='report',
+                        action='store_true',
+                        default=False,
+                        help='report the schedule and the predicted and actual conversion times')
+    parser.add_argument('--spool',
+                        dest='spool',
+                        type=str,
+                        default=None,
+                        help='spool directory, possibly shared between hosts, used as a work queue by --submit and --worker')
+    parser.add_argument('--submit',
+                        dest='submit',
+                        action='store_true',
+                        default=False,
+                        help='add the notebook(s), and the BibTeX database and CSL file if they exist, to the spool directory as new jobs, which workers convert with the --bib, --csl, --header, --kernel and --timeout options given here')
+    parser.add_argument('--worker',
+                        dest='worker',
+                        action='store_true',
+                        default=False,
+                        help='convert jobs claimed from the spool directory until none are left')
+    parser.add_argument('--lease',
+                        dest='lease',
+                        type=float,
+                        default=300.0,
+                        help='seconds after which a claim by an unresponsive worker is requeued')
+    parser.add_argument('--wait',
+                        dest='wait',
+                        action='store_true',
+                        default=False,
+                        help='keep the worker polling for new jobs instead of exiting when the spool is empty')
+    parser.add_argument('--event-log',
+                        dest='event_log',
+                        type=str,
+                        default=None,
+                        help='append a JSON-lines record of every progress event to the given file')
     parser.add_argument('--debug',
                         dest='debug',
                         action='store_true',
@@ -191,6 +289,10 @@ if __name__ == "__main__":
 
     # Parse the command-line arguments
     options = parser.parse_args()
+    options.memory_limit = int(options.memory_limit_mb * 2**20)
+    memory_budget = None
+    if options.memory_budget is not None:
+        memory_budget = int(options.memory_budget * 2**20)
 
     # Process the options
     if options.list_csl:
@@ -214,20 +316,66 @@ if __name__ == "__main__":
     if options.verbose:
         print(sep)
 
+    # Progress events
+    events = nbref.Events()
+    if options.event_log:
+        events.subscribe(nbref.JsonLinesLog(options.event_log))
+
+    # Spool directory work queue
+    if (options.submit or options.worker) and not options.spool:
+        parser.error("--submit and --worker require --spool")
+    if options.worker:
+        (succeeded, failed, requeued) = nbref.spool.run_worker(
+            options.spool, options, options.lease, wait=options.wait,
+            events=events)
+        if options.verbose:
+            print("%d job(s) done, %d job(s) failed, %d job(s) requeued" %
+                  (succeeded, failed, requeued))
+        parser.exit(1 if failed else 0)
+
+    # The history and the memory budget only schedule individual notebooks,
+    # and spilled outputs are not written into the output archive
+    if options.archive_out:
+        for (given, name) in [(options.memory_budget is not None,
+                               '--memory-budget'),
+                              (options.history is not None, '--history'),
+                              (not options.use_history, '--no-history'),
+                              (options.spill_outputs, '--spill-outputs')]:
+            if given:
+                parser.error("%s cannot be used with --archive-out" % name)
+
     # Check for no specified filenames. We allow len(options.files) == 0 up to
-    # this point so that we can execute the --list-csl or --list-csl-path
-    # options if requested.
+    # this point so that we can execute the --list-csl, --list-csl-path or
+    # --worker options if requested.
     if len(options.files) == 0:
         parser.error("too few arguments")
 
-    # Process the files
-    for filename in options.files:
-        if options.debug:
-            nbref.convert(filename, options)
-        else:
-            try:
-                nbref.convert(filename, options)
-            except Exception as e:
-                print("Error: %s" % str(e))
-        if options.verbose:
-            print(sep)
+    if options.submit:
+        extra_files = []
+        if os.path.isfile(options.bib):
+            extra_files.append(options.bib)
+        for filename in options.files:
+            job = nbref.spool.submit(options.spool, filename, extra_files,
+                                     options)
+            if options.verbose:
+                print('Submitted "%s" as job "%s"' % (filename, job))
+        parser.exit(0)
+
+    # Process the files, either as archives of notebooks or as notebooks
+    # converted longest expected conversion time first
+    history = None
+    start = time.time()
+    if options.archive_out:
+        results = nbref.convert_archive(options.files, options.archive_out,
+                                        options, options.jobs, events)
+    else:
+        # The schedule buys nothing for a plain sequential run
+        if options.use_history and (options.jobs > 1 or options.report or
+                                    options.history):
+            history = nbref.ExecutionHistory(options.history)
+        results = nbref.convert_batch(options.files, options, options.jobs,
+                                      history, events, memory_budget)
+    if options.report:
+        nbref.batch.print_schedule(results, time.time() - start)
+    if history is not None:
+        history.close()
@@ -0,0 +1,95 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Imports
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+# Find resources
+thisdir = os.path.dirname(os.path.abspath(__file__))
+basedir = os.path.normpath(os.path.join(thisdir, '..'))
+
+# Make sure that the nb2html.py script and the tests can find the nbref package
+python_path = os.environ.get("PYTHONPATH", '').split(':')
+if basedir not in python_path:
+    python_path.insert(0, basedir)
+os.environ["PYTHONPATH"] = ':'.join(python_path)
+if basedir not in sys.path:
+    sys.path.insert(0, basedir)
+
+import nbref
+
+################################################################################
+
+@pytest.fixture(scope='session', autouse=True)
+def nbref_cache_dir():
+    """
+    Point NBREF_CACHE_DIR, inherited by the nb2html.py subprocesses, at a
+    temporary directory, so that the tests do not write the execution history,
+    template cache or citation cache into the user's cache directory
+    """
+    cachedir = tempfile.mkdtemp()
+    old_cachedir = os.environ.get('NBREF_CACHE_DIR')
+    os.environ['NBREF_CACHE_DIR'] = cachedir
+    try:
+        yield cachedir
+    finally:
+        if old_cachedir is None:
+            del os.environ['NBREF_CACHE_DIR']
+        else:
+            os.environ['NBREF_CACHE_DIR'] = old_cachedir
+        shutil.rmtree(cachedir)
+
+################################################################################
+
+@pytest.fixture
+def temp_cache_dir(monkeypatch):
+    """
+    Point NBREF_CACHE_DIR at a fresh temporary directory for a single test
+    """
+    cachedir = tempfile.mkdtemp()
+    monkeypatch.setenv('NBREF_CACHE_DIR', cachedir)
+    yield cachedir
+    shutil.rmtree(cachedir)
+
+################################################################################
+
+@pytest.fixture
+def working_dir(monkeypatch):
+    """
+    Run the test in a fresh temporary working directory
+    """
+    testdir = tempfile.mkdtemp()
+    monkeypatch.chdir(testdir)
+    yield testdir
+    monkeypatch.undo()
+    shutil.rmtree(testdir)
+
+################################################################################
+
+@pytest.fixture
+def make_options():
+    """
+    Return a function that builds the options of nbref.convert() and friends,
+    as parsed by nb2html.py with no command line options, updated with the
+    given keyword arguments
+    """
+    def make(**settings):
+        default = nbref.AddCitationsPreprocessor()
+        options = argparse.Namespace(kernel='python%d' % sys.version_info.major,
+                                     timeout=60,
+                                     verbose=False,
+                                     debug=False,
+                                     csl=default.csl,
+                                     csl_path=default.csl_path,
+                                     bib=default.bibliography,
+                                     header=default.header)
+        for (name, value) in settings.items():
+            setattr(options, name, value)
+        return options
+    return make
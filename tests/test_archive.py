@@ -0,0 +1,151 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Imports
+import argparse
+import os
+import subprocess
+import sys
+import tarfile
+import zipfile
+
+import nbformat
+import pytest
+
+# Find resources
+thisdir = os.path.dirname(os.path.abspath(__file__))
+basedir = os.path.normpath(os.path.join(thisdir, '..'))
+script  = os.path.join(basedir, 'scripts', 'nb2html.py')
+
+import nbref
+
+################################################################################
+
+def notebook_json(source):
+    nb = nbformat.v4.new_notebook()
+    nb.cells.append(nbformat.v4.new_code_cell(source))
+    return nbformat.writes(nb)
+
+################################################################################
+
+def make_zip(filename):
+    with zipfile.ZipFile(filename, 'w') as archive:
+        archive.writestr('top.ipynb', notebook_json('print("top level")'))
+        archive.writestr('sub/data.txt', 'contents of data.txt')
+        archive.writestr('sub/nested.ipynb',
+                         notebook_json('print(open("data.txt").read())'))
+
+################################################################################
+
+def check_output(members, read):
+    assert sorted(members) == ['sub/nested.html', 'top.html']
+    assert 'top level'            in read('top.html')
+    assert 'contents of data.txt' in read('sub/nested.html')
+
+################################################################################
+
+def test_zip_to_tar(working_dir):
+    make_zip('in.zip')
+    subprocess.call([sys.executable, script, '--jobs', '2',
+                     '--archive-out', 'out.tar.gz', 'in.zip'])
+    with tarfile.open('out.tar.gz') as archive:
+        read = lambda name: archive.extractfile(name).read().decode('utf-8')
+        check_output(archive.getnames(), read)
+
+################################################################################
+
+def test_tar_to_zip(working_dir):
+    make_zip('in.zip')
+    os.mkdir('tree')
+    with zipfile.ZipFile('in.zip') as archive:
+        archive.extractall('tree')
+    with tarfile.open('in.tar', 'w') as archive:
+        archive.add('tree', arcname='.')
+    subprocess.call([sys.executable, script, '--archive-out', 'out.zip',
+                     'in.tar'])
+    with zipfile.ZipFile('out.zip') as archive:
+        read = lambda name: archive.read(name).decode('utf-8')
+        check_output(archive.namelist(), read)
+
+################################################################################
+
+def test_bib_lookup(working_dir):
+    for path in ['ref.bib', os.path.join('sub', 'ref.bib')]:
+        if not os.path.isdir(os.path.dirname(path) or '.'):
+            os.mkdir(os.path.dirname(path))
+        open(path, 'w').close()
+    options = argparse.Namespace(bib='ref.bib', csl_path=['.'])
+    member = nbref.archive._member_options('sub/a.ipynb', options, working_dir)
+    assert member.bib == os.path.join(working_dir, 'sub', 'ref.bib')
+    assert member.csl_path == [os.path.join(working_dir, 'sub'), '.']
+    member = nbref.archive._member_options('other/b.ipynb', options,
+                                           working_dir)
+    assert member.bib == os.path.join(working_dir, 'ref.bib')
+    member = nbref.archive._member_options('c.ipynb', options,
+                                           '/nonexistent')
+    assert member.bib == 'ref.bib'
+    assert options.csl_path == ['.']
+
+################################################################################
+
+def test_archives_do_not_share_files(working_dir, make_options):
+    for name in ['one', 'two']:
+        with zipfile.ZipFile(name + '.zip', 'w') as archive:
+            archive.writestr('data.txt', 'data of ' + name)
+            archive.writestr(name + '/read.ipynb', notebook_json(
+                'print(open("../data.txt").read())'))
+    results = nbref.convert_archive(['one.zip', 'two.zip'], 'out.zip',
+                                    make_options())
+    assert [result.error for result in results] == [None, None]
+    with zipfile.ZipFile('out.zip') as archive:
+        assert sorted(archive.namelist()) == ['one/read.html',
+                                              'two/read.html']
+        assert 'data of one' in archive.read('one/read.html').decode()
+        assert 'data of two' in archive.read('two/read.html').decode()
+
+################################################################################
+
+def test_duplicate_notebooks(working_dir, make_options):
+    for name in ['one', 'two']:
+        with zipfile.ZipFile(name + '.zip', 'w') as archive:
+            archive.writestr('same.ipynb', notebook_json('x = 1'))
+    with pytest.raises(ValueError, match='same.ipynb'):
+        nbref.convert_archive(['one.zip', 'two.zip'], 'out.zip',
+                              make_options())
+
+################################################################################
+
+def test_debug_propagates(working_dir, make_options):
+    with zipfile.ZipFile('in.zip', 'w') as archive:
+        archive.writestr('fail.ipynb',
+                         notebook_json('raise RuntimeError("boom")'))
+    results = nbref.convert_archive(['in.zip'], 'out.zip',
+                                    make_options())
+    assert 'boom' in results[0].error
+    with pytest.raises(Exception, match='boom'):
+        nbref.convert_archive(['in.zip'], 'out.zip',
+                              make_options(debug=True))
+
+################################################################################
+
+def test_without_debug_option(working_dir, make_options):
+    make_zip('in.zip')
+    options = make_options()
+    del options.debug
+    results = nbref.convert_archive(['in.zip'], 'out.zip', options)
+    assert [result.error for result in results] == [None, None]
+
+################################################################################
+
+@pytest.mark.parametrize('option', [['--memory-budget', '100'],
+                                    ['--history', 'history.sqlite'],
+                                    ['--no-history'],
+                                    ['--spill-outputs']])
+def test_unsupported_options(working_dir, option):
+    make_zip('in.zip')
+    process = subprocess.run([sys.executable, script, '--archive-out',
+                              'out.zip', 'in.zip'] + option,
+                             stderr=subprocess.PIPE, universal_newlines=True)
+    assert process.returncode == 2
+    assert '%s cannot be used with --archive-out' % option[0] in process.stderr
+    assert not os.path.exists('out.zip')
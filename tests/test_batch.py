@@ -0,0 +1,155 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Imports
+import os
+import shutil
+import tempfile
+
+import nbformat
+
+import nbref
+
+################################################################################
+
+def make_history():
+    testdir = tempfile.mkdtemp()
+    history = nbref.ExecutionHistory(os.path.join(testdir, 'history.sqlite'))
+    return (testdir, history)
+
+################################################################################
+
+def test_history_expected():
+    (testdir, history) = make_history()
+    try:
+        assert history.expected('a.ipynb') is None
+        history.record('a.ipynb', 10.0)
+        assert history.expected('a.ipynb') == 10.0
+        history.record('a.ipynb', 20.0)
+        assert history.expected('a.ipynb') == 15.0
+    finally:
+        history.close()
+        shutil.rmtree(testdir)
+
+################################################################################
+
+def test_schedule_longest_first():
+    (testdir, history) = make_history()
+    try:
+        history.record('fast.ipynb'  ,    1.0)
+        history.record('slow.ipynb'  , 1200.0)
+        history.record('medium.ipynb',   60.0)
+        files = ['fast.ipynb', 'new.ipynb', 'slow.ipynb', 'medium.ipynb']
+        order = nbref.schedule(files, history)
+        assert [f for (f, p) in order] == ['new.ipynb', 'slow.ipynb',
+                                           'medium.ipynb', 'fast.ipynb']
+        assert order[0][1] is None
+        assert order[1][1] == 1200.0
+    finally:
+        history.close()
+        shutil.rmtree(testdir)
+
+################################################################################
+
+def test_schedule_no_history():
+    files = ['b.ipynb', 'a.ipynb']
+    assert nbref.schedule(files) == [('b.ipynb', None), ('a.ipynb', None)]
+
+################################################################################
+
+def test_history_memory():
+    (testdir, history) = make_history()
+    try:
+        history.record('a.ipynb', 10.0)
+        assert history.expected_memory('a.ipynb') is None
+        history.record('a.ipynb', 10.0, 100.0)
+        assert history.expected_memory('a.ipynb') == 100.0
+        history.record('a.ipynb', 10.0, 300.0)
+        assert history.expected_memory('a.ipynb') == 200.0
+        assert history.expected('a.ipynb') == 10.0
+    finally:
+        history.close()
+        shutil.rmtree(testdir)
+
+################################################################################
+
+def test_memory_limit(make_options):
+    (testdir, history) = make_history()
+    curdir = os.getcwd()
+    os.chdir(testdir)
+    try:
+        for (name, source) in [('big'  , 'x = bytearray(400 * 2**20)'),
+                               ('small', 'x = 1'                     )]:
+            nb = nbformat.v4.new_notebook()
+            nb.cells.append(nbformat.v4.new_code_cell(source))
+            nbformat.write(nb, name + '.ipynb')
+        options = make_options(memory_limit=200 * 2**20)
+        results = nbref.convert_batch(['big.ipynb', 'small.ipynb'], options, 2,
+                                      history, memory_budget=1024 * 2**20)
+        (big, small) = results
+        assert 'memory limit' in big.error
+        assert small.error is None
+        assert small.memory > 0
+        assert history.expected_memory('small.ipynb') == small.memory
+        assert os.path.isfile('small.html')
+        assert not os.path.isfile('big.html')
+    finally:
+        os.chdir(curdir)
+        history.close()
+        shutil.rmtree(testdir)
+
+################################################################################
+
+def test_sequential_memory(make_options):
+    (testdir, history) = make_history()
+    curdir = os.getcwd()
+    os.chdir(testdir)
+    try:
+        # The big notebook's output inflates the peak memory of this process
+        for (name, source) in [('big'  , "print('x' * 50 * 2**20)"),
+                               ('small', 'x = 1'                  )]:
+            nb = nbformat.v4.new_notebook()
+            nb.cells.append(nbformat.v4.new_code_cell(source))
+            nbformat.write(nb, name + '.ipynb')
+        history.record('big.ipynb'  , 2.0)
+        history.record('small.ipynb', 1.0)
+        options = make_options(memory_limit=1024 * 2**20)
+        results = nbref.convert_batch(['big.ipynb', 'small.ipynb'], options, 1,
+                                      history)
+        (big, small) = results
+        assert big.error is None and small.error is None
+        assert small.memory > 0
+        assert history.expected_memory('small.ipynb') == small.memory
+        # Only the small notebook's kernel is measured, not the peak of this
+        # process left behind by the big notebook
+        assert small.memory < nbref.memory.peak_rss() - 100 * 2**20
+    finally:
+        os.chdir(curdir)
+        history.close()
+        shutil.rmtree(testdir)
+
+################################################################################
+
+def test_memory_not_measurable(working_dir, make_options, monkeypatch):
+    monkeypatch.setattr(nbref.memory, 'process_rss', lambda pid: None)
+    nb = nbformat.v4.new_notebook()
+    nb.cells.append(nbformat.v4.new_code_cell('x = 1'))
+    nbformat.write(nb, 'small.ipynb')
+    history = nbref.ExecutionHistory(os.path.join(working_dir,
+                                                  'history.sqlite'))
+    try:
+        # A memory limit that cannot be enforced fails the conversion
+        options = make_options(memory_limit=200 * 2**20)
+        (result,) = nbref.convert_batch(['small.ipynb'], options, 1, history)
+        assert 'Cannot enforce the memory limit' in result.error
+        assert not os.path.isfile('small.html')
+
+        # Without a limit, the unmeasured memory is not recorded
+        (result,) = nbref.convert_batch(['small.ipynb'], make_options(), 1,
+                                        history, memory_budget=1024 * 2**20)
+        assert result.error is None
+        assert result.memory is None
+        assert history.expected('small.ipynb') is not None
+        assert history.expected_memory('small.ipynb') is None
+    finally:
+        history.close()
@@ -0,0 +1,152 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Imports
+import asyncio
+import copy
+import os
+import shutil
+import tempfile
+import time
+
+import nbformat
+
+# Find resources
+thisdir      = os.path.dirname(os.path.abspath(__file__))
+basedir      = os.path.normpath(os.path.join(thisdir, '..'))
+notebook_src = os.path.join(basedir, 'notebooks', 'SimpleCitation.ipynb')
+bib_src      = os.path.join(basedir, 'notebooks', 'ref.bib')
+
+import nbref
+
+################################################################################
+
+def _preprocessor(cache_file, runs):
+    """
+    Return an AddCitationsPreprocessor using the given cache, whose pandoc run
+    is replaced by one that records its input in runs and returns one fake
+    citation paragraph per citation followed by a references paragraph
+    """
+    preprocessor = nbref.AddCitationsPreprocessor(bibliography=bib_src,
+                                                  cache_file=cache_file)
+    def run_pandoc(body, csl_file):
+        runs.append(body)
+        citations = body.split()
+        lines = ['<p><span class="citation">[%s]</span></p>' % citation
+                 for citation in citations]
+        return '\n'.join(lines + ['<div>references</div>'])
+    preprocessor._run_pandoc = run_pandoc
+    return preprocessor
+
+################################################################################
+
+def test_extract_matches_uncached():
+    notebook = nbref.load_notebook(notebook_src)
+    tempdir = tempfile.mkdtemp()
+    try:
+        cache_file = os.path.join(tempdir, 'citations.sqlite')
+        uncached = nbref.AddCitationsPreprocessor()
+        cached   = nbref.AddCitationsPreprocessor(cache_file=cache_file)
+        expected = uncached._extract_citations(notebook)
+        assert expected
+        for i in range(2):
+            cache = cached._open_cache()
+            try:
+                assert cached._extract_citations(notebook, cache) == expected
+            finally:
+                cached._close_cache(cache)
+    finally:
+        shutil.rmtree(tempdir)
+
+################################################################################
+
+def test_rendered_citations_reused():
+    notebook = nbref.load_notebook(notebook_src)
+    tempdir = tempfile.mkdtemp()
+    try:
+        cache_file = os.path.join(tempdir, 'citations.sqlite')
+        runs = []
+        (first, resources) = _preprocessor(cache_file, runs).preprocess(
+            copy.deepcopy(notebook), {})
+        assert len(runs) == 1
+
+        # An unchanged set of citations is not rendered again
+        (second, resources) = _preprocessor(cache_file, runs).preprocess(
+            copy.deepcopy(notebook), {})
+        assert len(runs) == 1
+        assert second == first
+
+        # Editing a cell without changing its citations reuses the rendering
+        edited = copy.deepcopy(notebook)
+        edited.cells.append(nbformat.v4.new_markdown_cell('No citations here'))
+        _preprocessor(cache_file, runs).preprocess(edited, {})
+        assert len(runs) == 1
+
+        # A new citation is rendered
+        edited = copy.deepcopy(notebook)
+        edited.cells.append(nbformat.v4.new_markdown_cell('See @NewKey.'))
+        (third, resources) = _preprocessor(cache_file, runs).preprocess(
+            edited, {})
+        assert len(runs) == 2
+        assert '@NewKey' in runs[-1]
+        assert third.cells[-3].source == 'See [@NewKey].'
+    finally:
+        shutil.rmtree(tempdir)
+
+################################################################################
+
+def test_concurrent_async_preprocess():
+    notebook = nbref.load_notebook(notebook_src)
+    tempdir = tempfile.mkdtemp()
+    try:
+        cache_file = os.path.join(tempdir, 'citations.sqlite')
+        runs = []
+
+        async def run_pandoc(body, csl_file):
+            runs.append(body)
+            await asyncio.sleep(1)
+            return _preprocessor(cache_file, [])._run_pandoc(body, csl_file)
+
+        async def preprocess_both():
+            tasks = []
+            for extra in ('See @KeyOne.', 'See @KeyTwo.'):
+                edited = copy.deepcopy(notebook)
+                edited.cells.append(nbformat.v4.new_markdown_cell(extra))
+                preprocessor = _preprocessor(cache_file, runs)
+                preprocessor._async_run_pandoc = run_pandoc
+                tasks.append(preprocessor.async_preprocess(edited, {}))
+            return await asyncio.wait_for(asyncio.gather(*tasks), 10)
+
+        # Each conversion's cache transactions are committed before pandoc
+        # runs, so neither waits for the other's pandoc run
+        start = time.time()
+        results = asyncio.run(preprocess_both())
+        assert time.time() - start < 5
+        assert len(runs) == 2
+        assert results[0][0].cells[-3].source == 'See [@KeyOne].'
+        assert results[1][0].cells[-3].source == 'See [@KeyTwo].'
+    finally:
+        shutil.rmtree(tempdir)
+
+################################################################################
+
+def test_unusable_cache(working_dir):
+    notebook = nbref.load_notebook(notebook_src)
+    open('not_a_directory', 'w').close()
+    cache_file = os.path.join('not_a_directory', 'citations.sqlite')
+    runs = []
+    (nb, resources) = _preprocessor(cache_file, runs).preprocess(notebook, {})
+    assert len(runs) == 1
+    assert nb.cells[-2].source == '## References'
+
+################################################################################
+
+def test_cache_off_for_api(working_dir, temp_cache_dir, make_options):
+    nb = nbformat.v4.new_notebook()
+    nb.cells.append(nbformat.v4.new_markdown_cell('No citations here'))
+    nbformat.write(nb, 'plain.ipynb')
+    nbref.convert('plain.ipynb', make_options())
+    assert os.path.isfile('plain.html')
+    assert not os.path.exists(os.path.join(temp_cache_dir, 'citations.sqlite'))
+    nbref.convert('plain.ipynb', make_options(citation_cache=True))
+    assert os.path.isfile(os.path.join(temp_cache_dir, 'citations.sqlite'))
@@ -0,0 +1,65 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Imports
+import asyncio
+import io
+import os
+import threading
+
+import nbformat
+
+import nbref
+
+################################################################################
+
+def write_notebook(filename, source):
+    nb = nbformat.v4.new_notebook()
+    nb.cells.append(nbformat.v4.new_code_cell(source))
+    nbformat.write(nb, filename)
+
+################################################################################
+
+def test_convert_async_concurrent(working_dir, make_options):
+    names = ['nb%d' % i for i in range(3)]
+    for name in names:
+        write_notebook(name + '.ipynb', 'print("output of %s")' % name)
+
+    async def convert_all():
+        await asyncio.gather(*[nbref.convert_async(name + '.ipynb',
+                                                   make_options())
+                               for name in names])
+    asyncio.run(convert_all())
+
+    for name in names:
+        with io.open(name + '.html', 'r') as html_file:
+            assert 'output of %s' % name in html_file.read()
+
+################################################################################
+
+def test_convert_async_timeout(working_dir, make_options):
+    write_notebook('slow.ipynb', 'import time\ntime.sleep(60)')
+    try:
+        asyncio.run(nbref.convert_async('slow.ipynb', make_options(),
+                                        timeout=5))
+    except asyncio.TimeoutError:
+        pass
+    else:
+        assert False, 'expected asyncio.TimeoutError'
+    assert not os.path.exists('slow.html')
+
+################################################################################
+
+def test_convert_async_blocking_steps(working_dir, make_options):
+    write_notebook('steps.ipynb', 'x = 1')
+    threads = {}
+    events = nbref.Events()
+    events.subscribe(lambda record: threads.setdefault(
+        record['event'], threading.current_thread()))
+    asyncio.run(nbref.convert_async('steps.ipynb', make_options(),
+                                    events=events))
+
+    # Reading, rendering and writing the notebook do not block the event loop
+    for event in ['notebook_loaded', 'conversion_started', 'file_written']:
+        assert threads[event] is not threading.main_thread()
+    assert threads['notebook_finished'] is threading.main_thread()
@@ -0,0 +1,87 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Imports
+import json
+import os
+import subprocess
+import sys
+
+import nbformat
+
+# Find resources
+thisdir = os.path.dirname(os.path.abspath(__file__))
+basedir = os.path.normpath(os.path.join(thisdir, '..'))
+script  = os.path.join(basedir, 'scripts', 'nb2html.py')
+
+import nbref
+
+################################################################################
+
+def write_notebook(filename):
+    nb = nbformat.v4.new_notebook()
+    nb.cells.append(nbformat.v4.new_markdown_cell('No citations here'))
+    nb.cells.append(nbformat.v4.new_code_cell('x = 1'))
+    nb.cells.append(nbformat.v4.new_code_cell('print(x)'))
+    nb.cells.append(nbformat.v4.new_code_cell('  '))
+    nbformat.write(nb, filename)
+
+################################################################################
+
+def test_events(working_dir, make_options):
+    write_notebook('events.ipynb')
+    options = make_options()
+    records = []
+    events = nbref.Events()
+    events.subscribe(records.append)
+    nbref.convert('events.ipynb', options, events)
+
+    names = [record['event'] for record in records]
+    assert names[0] == 'notebook_started'
+    assert names[-1] == 'notebook_finished'
+    assert 'execution_started' in names
+    assert 'conversion_started' in names
+    for record in records:
+        assert record['notebook'] == 'events.ipynb'
+    cells = [r for r in records if r['event'] == 'cell_executed']
+    assert [cell['index'] for cell in cells] == [1, 2]
+    found = [r for r in records if r['event'] == 'citations_found']
+    assert found[0]['count'] == 0
+    written = [r for r in records if r['event'] == 'file_written'][0]
+    assert written['size'] == os.path.getsize('events.html')
+
+################################################################################
+
+def test_event_log(working_dir):
+    write_notebook('a.ipynb')
+    write_notebook('b.ipynb')
+    subprocess.call([sys.executable, script, '--jobs', '2', '--no-history',
+                     '--event-log', 'events.jsonl', 'a.ipynb', 'b.ipynb'])
+    with open('events.jsonl') as log:
+        records = [json.loads(line) for line in log]
+    for notebook in ['a.ipynb', 'b.ipynb']:
+        names = [r['event'] for r in records if r['notebook'] == notebook]
+        assert 'notebook_started'  in names
+        assert 'cell_executed'     in names
+        assert 'notebook_finished' in names
+
+################################################################################
+
+def test_verbose_prints_once(working_dir, make_options, capsys):
+    write_notebook('verbose.ipynb')
+    options = make_options(verbose=True)
+    events = nbref.Events()
+    events.subscribe(nbref.print_event)
+    nbref.convert('verbose.ipynb', options, events)
+    out = capsys.readouterr().out
+    assert out.count('Executing notebook...') == 1
+    assert out.count('0 citations found'   ) == 1
+    assert events.callbacks == [nbref.print_event]
+
+    # A verbose preprocessor prints without subscribing to its Events
+    events = nbref.Events()
+    preprocessor = nbref.AddCitationsPreprocessor(verbose=True,
+                                                  events=events)
+    preprocessor._emit('citations_found', count=1, citations=['@a'])
+    assert capsys.readouterr().out == '    1 citation found\n'
+    assert events.callbacks == []
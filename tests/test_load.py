@@ -0,0 +1,35 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Imports
+import os
+
+import nbformat
+
+# Find resources
+thisdir      = os.path.dirname(os.path.abspath(__file__))
+basedir      = os.path.normpath(os.path.join(thisdir, '..'))
+notebook_src = os.path.join(basedir, 'notebooks', 'SimpleCitation.ipynb')
+
+import nbref
+
+################################################################################
+
+def test_load_matches_nbformat():
+    with open(notebook_src) as notebook_file:
+        expected = nbformat.reads(notebook_file.read(), as_version=4)
+    for mode in nbref.load.validate_modes:
+        assert nbref.load_notebook(notebook_src, mode) == expected
+
+################################################################################
+
+def test_validate_new(temp_cache_dir):
+    records = []
+    events = nbref.Events()
+    events.subscribe(records.append)
+    nbref.load_notebook(notebook_src, 'new', events)
+    nbref.load_notebook(notebook_src, 'new', events)
+    nbref.load_notebook(notebook_src, 'never', events)
+    assert [r['validated'] for r in records] == [True, False, False]
+    assert records[0]['event'] == 'notebook_loaded'
+    assert records[0]['duration'] >= 0.0
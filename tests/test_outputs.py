@@ -0,0 +1,104 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Imports
+import io
+import os
+import subprocess
+import sys
+
+import nbformat
+
+# Find resources
+thisdir = os.path.dirname(os.path.abspath(__file__))
+basedir = os.path.normpath(os.path.join(thisdir, '..'))
+script  = os.path.join(basedir, 'scripts', 'nb2html.py')
+
+import nbref.outputs
+
+################################################################################
+
+def test_stream_head_and_tail(working_dir):
+    limiter = nbref.outputs.OutputLimiter(3, max_stream=100,
+                                          spill_dir='spill')
+    chunks = ['line %05d\n' % i for i in range(1000)]
+    kept = ''.join([limiter.stream_text('stdout', chunk)
+                    for chunk in chunks])
+    assert kept == ''.join(chunks)[:50]
+    outputs = limiter.finish()
+    assert outputs[0].text.endswith(''.join(chunks)[-50:])
+    assert 'characters omitted' in outputs[0].text
+    assert 'href="cell3_stdout.txt"' in outputs[1].data['text/html']
+    with io.open(os.path.join('spill', 'cell3_stdout.txt')) as spill:
+        assert spill.read() == ''.join(chunks)
+
+################################################################################
+
+def test_cell_limit():
+    limiter = nbref.outputs.OutputLimiter(0, max_cell=100)
+    assert limiter.stream_text('stdout', 'x' * 60) == 'x' * 60
+    assert limiter.keep_output(30)
+    assert not limiter.keep_output(30)
+    assert limiter.stream_text('stderr', 'y' * 60) == 'y' * 10
+    outputs = limiter.finish()
+    assert outputs[-1].text == '... [1 outputs omitted] ...\n'
+
+################################################################################
+
+def test_unlimited():
+    limiter = nbref.outputs.OutputLimiter(0)
+    assert limiter.stream_text('stdout', 'x' * 10**6) == 'x' * 10**6
+    assert limiter.traceback(['a' * 10**4]) == ['a' * 10**4]
+    assert limiter.finish() == []
+
+################################################################################
+
+def test_capped_conversion(working_dir):
+    nb = nbformat.v4.new_notebook()
+    nb.cells.append(nbformat.v4.new_code_cell(
+        'for i in range(200000):\n    print("line %d" % i)'))
+    nbformat.write(nb, 'loud.ipynb')
+    subprocess.call([sys.executable, script, '--no-history',
+                     '--max-stream-output', '10000', '--spill-outputs',
+                     'loud.ipynb'])
+    with io.open('loud.html') as html_file:
+        html = html_file.read()
+    assert 'line 0\n' in html
+    assert 'line 199999' in html
+    assert 'line 100000\n' not in html
+    assert 'loud_outputs/cell0_stdout.txt' in html
+    spill = os.path.join('loud_outputs', 'cell0_stdout.txt')
+    with io.open(spill) as spill_file:
+        assert spill_file.read().count('\n') == 200000
+
+################################################################################
+
+def test_clear_keeps_spill_file(working_dir):
+    limiter = nbref.outputs.OutputLimiter(2, max_stream=10,
+                                          spill_dir='spill')
+    before = ''.join(['before %d\n' % i for i in range(10)])
+    after  = ''.join(['after %d\n'  % i for i in range(10)])
+    limiter.stream_text('stdout', before)
+    limiter.clear()
+    assert limiter.stream_text('stdout', after) == after[:5]
+    outputs = limiter.finish()
+    assert outputs[0].text.endswith(after[-5:])
+    with io.open(os.path.join('spill', 'cell2_stdout.txt')) as spill:
+        assert spill.read() == before + after
+
+################################################################################
+
+def test_deferred_clear_of_dropped_output(working_dir):
+    nb = nbformat.v4.new_notebook()
+    nb.cells.append(nbformat.v4.new_code_cell(
+        'from IPython.display import HTML, clear_output, display\n'
+        'print("stale " + "output")\n'
+        'clear_output(wait=True)\n'
+        'display(HTML("x" * 1000))'))
+    nbformat.write(nb, 'progress.ipynb')
+    subprocess.call([sys.executable, script, '--max-cell-output', '100',
+                     'progress.ipynb'])
+    with io.open('progress.html') as html_file:
+        html = html_file.read()
+    assert 'stale output' not in html
+    assert '[1 outputs omitted]' in html
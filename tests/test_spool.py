@@ -0,0 +1,151 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Imports
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import nbformat
+
+# Find resources
+thisdir      = os.path.dirname(os.path.abspath(__file__))
+basedir      = os.path.normpath(os.path.join(thisdir, '..'))
+script       = os.path.join(basedir, 'scripts', 'nb2html.py')
+notebook     = 'SimpleCitation.ipynb'
+notebook_src = os.path.join(basedir, 'notebooks', notebook)
+bib_src      = os.path.join(basedir, 'notebooks', 'ref.bib')
+
+import nbref
+import nbref.spool
+
+################################################################################
+
+def make_notebook(dirname, name, source):
+    """
+    Write a notebook with a single code cell, and no citations, to the given
+    directory and return its filename
+    """
+    filename = os.path.join(dirname, name)
+    nb = nbformat.v4.new_notebook()
+    nb.cells.append(nbformat.v4.new_code_cell(source))
+    nbformat.write(nb, filename)
+    return filename
+
+################################################################################
+
+def test_workers():
+    spool_dir = tempfile.mkdtemp()
+    try:
+        # Submit the jobs, with a BibTeX file not named like the default
+        num_jobs = 6
+        plain = make_notebook(spool_dir, 'Plain.ipynb', 'print(6 * 7)')
+        bib = os.path.join(spool_dir, 'mine.bib')
+        shutil.copy(bib_src, bib)
+        subprocess.check_call([sys.executable, script, '--spool', spool_dir,
+                               '--submit', '--bib', bib] +
+                              [plain] * num_jobs)
+        assert len(os.listdir(os.path.join(spool_dir, 'incoming'))) == num_jobs
+
+        # Run several workers concurrently against the spool directory
+        workers = [subprocess.Popen([sys.executable, script, '--spool',
+                                     spool_dir, '--worker'])
+                   for i in range(3)]
+        for worker in workers:
+            assert worker.wait() == 0
+
+        # Every job must have succeeded exactly once, with a status record
+        done = os.listdir(os.path.join(spool_dir, 'done'))
+        assert len(done) == num_jobs
+        assert os.listdir(os.path.join(spool_dir, 'failed'  )) == []
+        assert os.listdir(os.path.join(spool_dir, 'incoming')) == []
+        assert os.listdir(os.path.join(spool_dir, 'claimed' )) == []
+        assert os.listdir(os.path.join(spool_dir, 'tmp'     )) == []
+        for job in done:
+            jobdir = os.path.join(spool_dir, 'done', job)
+            assert os.path.isfile(os.path.join(jobdir, 'Plain.html'))
+            with open(os.path.join(jobdir, 'job.json')) as manifest_file:
+                assert json.load(manifest_file)['bib'] == 'mine.bib'
+            with open(os.path.join(jobdir, 'status.json')) as status_file:
+                status = json.load(status_file)
+            assert status['job'] == job
+            assert status['notebook'] == 'Plain.ipynb'
+            assert status['error'] is None
+            assert status['outputs'] == ['Plain.html']
+    finally:
+        shutil.rmtree(spool_dir)
+
+################################################################################
+
+def test_job_options():
+    spool_dir = tempfile.mkdtemp()
+    try:
+        # The worker must use the timeout the job was submitted with
+        slow = make_notebook(spool_dir, 'Slow.ipynb',
+                             'import time\ntime.sleep(30)')
+        subprocess.check_call([sys.executable, script, '--spool', spool_dir,
+                               '--submit', '--timeout', '2', slow])
+        # The worker must report the failed job in its exit status
+        assert subprocess.call([sys.executable, script, '--spool', spool_dir,
+                                '--worker']) == 1
+        (job,) = os.listdir(os.path.join(spool_dir, 'failed'))
+        with open(os.path.join(spool_dir, 'failed', job,
+                               'status.json')) as status_file:
+            assert 'timed out' in json.load(status_file)['error']
+    finally:
+        shutil.rmtree(spool_dir)
+
+################################################################################
+
+def test_requeued_claim(make_options):
+    spool_dir = tempfile.mkdtemp()
+    try:
+        slow = make_notebook(spool_dir, 'Slow.ipynb',
+                             'import time\ntime.sleep(3)')
+        job = nbref.spool.submit(spool_dir, slow)
+        (job, path) = nbref.spool._claim(spool_dir, 'stalled.1')
+
+        # Requeue the claim while the conversion is running, as reap_stale()
+        # does when the worker's heartbeat stalls
+        incoming = os.path.join(spool_dir, 'incoming', job)
+        reaper = threading.Timer(1.0, os.rename, (path, incoming))
+        reaper.start()
+        options = make_options()
+        try:
+            assert nbref.spool._run_job(spool_dir, job, path, 'stalled.1',
+                                        options, 0.3, None) is None
+        finally:
+            reaper.join()
+
+        # The result is discarded and nothing is written into the requeued job
+        assert sorted(os.listdir(incoming)) == ['.lease', 'Slow.ipynb']
+        assert os.listdir(os.path.join(spool_dir, 'done')) == []
+        assert os.listdir(os.path.join(spool_dir, 'tmp' )) == []
+    finally:
+        shutil.rmtree(spool_dir)
+
+################################################################################
+
+def test_reap_stale():
+    spool_dir = tempfile.mkdtemp()
+    try:
+        job = nbref.spool.submit(spool_dir, notebook_src)
+
+        # Simulate a worker that claimed the job and then crashed
+        claimed = os.path.join(spool_dir, 'claimed', job + '@crashed.1')
+        os.rename(os.path.join(spool_dir, 'incoming', job), claimed)
+        lease = os.path.join(claimed, '.lease')
+        open(lease, 'w').close()
+        assert nbref.spool.reap_stale(spool_dir, 60.0) == []
+        old = time.time() - 120.0
+        os.utime(lease, (old, old))
+        assert nbref.spool.reap_stale(spool_dir, 60.0) == [job]
+        assert os.listdir(os.path.join(spool_dir, 'incoming')) == [job]
+        assert os.listdir(os.path.join(spool_dir, 'claimed' )) == []
+    finally:
+        shutil.rmtree(spool_dir)
@@ -0,0 +1,85 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Imports
+import os
+import subprocess
+import sys
+
+import nbformat
+
+# Find resources
+thisdir = os.path.dirname(os.path.abspath(__file__))
+basedir = os.path.normpath(os.path.join(thisdir, '..'))
+script  = os.path.join(basedir, 'scripts', 'nb2html.py')
+
+import nbref
+
+################################################################################
+
+def cached_templates(cachedir):
+    """
+    Return the list of compiled template files in the given cache directory
+    """
+    files = []
+    for (dirpath, dirnames, filenames) in os.walk(os.path.join(cachedir,
+                                                               'templates')):
+        files.extend(filenames)
+    return files
+
+################################################################################
+
+def test_template_cache(temp_cache_dir):
+    nb = nbformat.v4.new_notebook()
+    nb.cells.append(nbformat.v4.new_markdown_cell('Hello'))
+    (body, resources) = nbref.CachedHTMLExporter().from_notebook_node(nb)
+    assert 'Hello' in body
+    assert cached_templates(temp_cache_dir)
+
+    # A second exporter loads the compiled templates instead of compiling and
+    # storing them again
+    module = sys.modules[nbref.CachedHTMLExporter.__module__]
+    cache = module.template_bytecode_cache()
+    dumped = []
+    dump_bytecode = cache.dump_bytecode
+    cache.dump_bytecode = lambda bucket: dumped.append(bucket.key)
+    try:
+        (again, resources) = nbref.CachedHTMLExporter().from_notebook_node(nb)
+    finally:
+        cache.dump_bytecode = dump_bytecode
+    assert again == body
+    assert dumped == []
+
+################################################################################
+
+def test_no_template_cache(temp_cache_dir, working_dir):
+    nb = nbformat.v4.new_notebook()
+    nb.cells.append(nbformat.v4.new_markdown_cell('Hello'))
+    exporter = nbref.CachedHTMLExporter(template_cache=False)
+    (body, resources) = exporter.from_notebook_node(nb)
+    assert 'Hello' in body
+    assert cached_templates(temp_cache_dir) == []
+
+    # The same from the command line
+    nbformat.write(nb, 'plain.ipynb')
+    subprocess.check_call([sys.executable, script, '--no-template-cache',
+                           'plain.ipynb'])
+    assert os.path.isfile('plain.html')
+    assert cached_templates(temp_cache_dir) == []
+
+################################################################################
+
+def test_unusable_cache_dir(working_dir, monkeypatch):
+    # The cache directory cannot be created under a regular file
+    open('not_a_directory', 'w').close()
+    monkeypatch.setenv('NBREF_CACHE_DIR',
+                       os.path.join(working_dir, 'not_a_directory', 'nbref'))
+    nb = nbformat.v4.new_notebook()
+    nb.cells.append(nbformat.v4.new_markdown_cell('Hello'))
+    (body, resources) = nbref.CachedHTMLExporter().from_notebook_node(nb)
+    assert 'Hello' in body
+
+    # The command line, with its default caches, still writes the HTML file
+    nbformat.write(nb, 'plain.ipynb')
+    subprocess.check_call([sys.executable, script, 'plain.ipynb'])
+    assert os.path.isfile('plain.html')